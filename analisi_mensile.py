@@ -1,10 +1,18 @@
 """
 Script principale per l'analisi mensile dei flussi di cassa.
-Esegue in sequenza: estrazione dati -> generazione grafici -> report personalizzato
+Esegue: estrazione dati -> generazione grafici -> report personalizzato
 
 USO:
     python analisi_mensile.py
 
+Gli script vengono eseguiti nello stesso processo (un solo avvio di Python e un
+solo import di pandas/matplotlib). Con la variabile d'ambiente ANALISI_SUBPROCESS=1
+ogni script viene invece lanciato con l'interprete di .venv, e grafici e report
+girano in parallelo:
+    set ANALISI_SUBPROCESS=1
+    python analisi_mensile.py
+    python analisi_mensile.py --sequential   (step uno alla volta, utile per il debug)
+
 Questo script:
 1. Estrae i dati dal file Excel "Flusso di cassa.xlsx"
 2. Genera i file CSV e JSON con i dati strutturati
@@ -15,10 +23,12 @@ Questo script:
 Eseguire ogni mese dopo aver aggiornato il file Excel.
 """
 
+import importlib
 import subprocess
 import sys
 import os
 import glob
+import traceback
 from datetime import datetime
 
 # Directory dello script (per path relativi - permette di spostare la cartella)
@@ -26,16 +36,24 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 WORK_DIR = SCRIPT_DIR
 PYTHON_EXE = os.path.join(SCRIPT_DIR, ".venv", "Scripts", "python.exe")
 
+# Esegui gli script come processi separati invece di importarli (ANALISI_SUBPROCESS=1)
+USA_SUBPROCESS = os.environ.get("ANALISI_SUBPROCESS") == "1"
+
+
+def _stampa_intestazione(script_name, descrizione):
+    """Stampa l'intestazione di uno step."""
+    print(f"\n{'─' * 60}")
+    print(f"▶ {descrizione}")
+    print(f"  Script: {script_name}")
+    print(f"{'─' * 60}\n")
+
 
 def esegui_script(script_name, descrizione):
     """Esegue uno script Python e gestisce gli errori."""
     
     script_path = os.path.join(WORK_DIR, script_name)
     
-    print(f"\n{'─' * 60}")
-    print(f"▶ {descrizione}")
-    print(f"  Script: {script_name}")
-    print(f"{'─' * 60}\n")
+    _stampa_intestazione(script_name, descrizione)
     
     try:
         result = subprocess.run(
@@ -56,6 +74,78 @@ def esegui_script(script_name, descrizione):
         return False
 
 
+def esegui_modulo(script_name, descrizione):
+    """
+    Esegue uno script importandolo come modulo nel processo corrente e
+    chiamandone main(), senza avviare un nuovo interprete Python.
+    """
+    
+    _stampa_intestazione(script_name, descrizione)
+    
+    try:
+        modulo = importlib.import_module(os.path.splitext(script_name)[0])
+        modulo.main()
+        return True
+    
+    except SystemExit as e:
+        if e.code in (None, 0):
+            return True
+        print(f"\n❌ ERRORE: {script_name} terminato con codice {e.code}")
+        return False
+    
+    except Exception as e:
+        print(f"\n❌ ERRORE nell'esecuzione di {script_name}: {e}")
+        traceback.print_exc()
+        return False
+
+
+def avvia_script(script_name):
+    """
+    Avvia uno script Python in background catturandone l'output,
+    così più script possono girare in parallelo senza mescolare i messaggi.
+    
+    Returns:
+        Il processo avviato, oppure None in caso di errore
+    """
+    script_path = os.path.join(WORK_DIR, script_name)
+    
+    # Forza UTF-8 sulla pipe: la codifica di default su Windows non supporta le emoji
+    env = dict(os.environ, PYTHONIOENCODING='utf-8')
+    
+    try:
+        return subprocess.Popen(
+            [PYTHON_EXE, script_path],
+            cwd=WORK_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            env=env
+        )
+    except Exception as e:
+        print(f"\n❌ ERRORE nell'esecuzione di {script_name}: {e}")
+        return None
+
+
+def attendi_script(processo, script_name, descrizione):
+    """Attende uno script avviato con avvia_script, ne stampa l'output e gestisce gli errori."""
+    
+    if processo is None:
+        return False
+    
+    output, _ = processo.communicate()
+    
+    _stampa_intestazione(script_name, descrizione)
+    print(output, end='')
+    
+    if processo.returncode != 0:
+        print(f"\n❌ ERRORE: {script_name} terminato con codice {processo.returncode}")
+        return False
+    
+    return True
+
+
 def pulisci_file_temporanei():
     """Elimina i file CSV e JSON temporanei generati durante l'analisi."""
     print("\n🗑️  Pulizia file temporanei...")
@@ -68,12 +158,13 @@ def pulisci_file_temporanei():
     
     eliminati = 0
     for f in files_temp:
-        if os.path.exists(f):
-            try:
-                os.remove(f)
-                eliminati += 1
-            except Exception as e:
-                print(f"   ⚠️ Errore eliminando {os.path.basename(f)}: {e}")
+        try:
+            os.remove(f)
+            eliminati += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"   ⚠️ Errore eliminando {os.path.basename(f)}: {e}")
     
     print(f"   ✅ Eliminati {eliminati} file temporanei")
 
@@ -96,21 +187,38 @@ def main():
     print(f"\n✅ File Excel trovato: {excel_file}")
     print(f"   Ultima modifica: {datetime.fromtimestamp(os.path.getmtime(excel_file)).strftime('%d/%m/%Y %H:%M')}")
     
+    esegui = esegui_script if USA_SUBPROCESS else esegui_modulo
+    
     # Step 1: Estrazione dati
-    if not esegui_script("estrai_flussi_cassa.py", "STEP 1: Estrazione dati da Excel"):
+    if not esegui("estrai_flussi_cassa.py", "STEP 1: Estrazione dati da Excel"):
         print("\n⛔ Analisi interrotta per errore nell'estrazione dati.")
         sys.exit(1)
     
-    # Step 2: Generazione grafici
-    if not esegui_script("genera_grafici.py", "STEP 2: Generazione grafici"):
-        print("\n⚠️ Attenzione: errore nella generazione grafici, ma i dati sono stati estratti.")
-    
-    # Step 3 & 4: Generazione report personalizzato (se esiste il file config)
+    # Step 2, 3 & 4: grafici e report personalizzato (se esiste il file config).
+    # Leggono entrambi i dati dello step 1 ma sono indipendenti tra loro:
+    # come processi separati possono girare in parallelo.
     config_file = os.path.join(WORK_DIR, "Categorie_per_grafici.csv")
+    
+    passi = [
+        ("genera_grafici.py", "STEP 2: Generazione grafici",
+         "\n⚠️ Attenzione: errore nella generazione grafici, ma i dati sono stati estratti."),
+    ]
     if os.path.exists(config_file):
-        if not esegui_script("genera_report.py", "STEP 3-4: Grafici aggregati e Report Markdown"):
-            print("\n⚠️ Attenzione: errore nella generazione report personalizzato.")
+        passi.append(("genera_report.py", "STEP 3-4: Grafici aggregati e Report Markdown",
+                      "\n⚠️ Attenzione: errore nella generazione report personalizzato."))
+    
+    if not USA_SUBPROCESS or '--sequential' in sys.argv:
+        esiti = [esegui(script, descrizione) for script, descrizione, _ in passi]
     else:
+        processi = [avvia_script(script) for script, _, _ in passi]
+        esiti = [attendi_script(processo, script, descrizione)
+                 for processo, (script, descrizione, _) in zip(processi, passi)]
+    
+    for (_, _, messaggio_errore), ok in zip(passi, esiti):
+        if not ok:
+            print(messaggio_errore)
+    
+    if not os.path.exists(config_file):
         print(f"\n⚠️ File {config_file} non trovato, skip step 3-4.")
     
     # Pulizia file temporanei
@@ -6,49 +6,242 @@ dai fogli Pivot del file Excel.
 import pandas as pd
 from openpyxl import load_workbook
 from datetime import datetime
+import csv
+import hashlib
 import json
 import re
 import sys
 import os
 
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # Opzionale: senza python-calamine l'Excel viene letto con openpyxl
+    CalamineWorkbook = None
+
 # Directory dello script (per path relativi)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Percorso del file Excel (relativo alla directory dello script)
 FILE_PATH = os.path.join(SCRIPT_DIR, "Flusso di cassa.xlsx")
 
+# File di output
+CSV_DETTAGLIO = os.path.join(SCRIPT_DIR, "flussi_cassa_dettaglio.csv")
+CSV_RIEPILOGO = os.path.join(SCRIPT_DIR, "flussi_cassa_riepilogo.csv")
+JSON_OUTPUT = os.path.join(SCRIPT_DIR, "flussi_cassa.json")
+COLONNE_DETTAGLIO = ['data', 'data_label', 'mese', 'anno',
+                     'categoria', 'sottocategoria', 'importo', 'tipo']
+
+# Cache CSV dei fogli Pivot e dei dati estratti: le esecuzioni successive non
+# rileggono l'Excel né rielaborano i fogli finché il file non viene modificato
+# (False = leggi ed elabora sempre dall'Excel)
+USA_CACHE_CSV = True
+CACHE_DIR = os.path.join(SCRIPT_DIR, ".cache")
+CACHE_INDICE = os.path.join(CACHE_DIR, "indice.json")
+CACHE_RISULTATI = os.path.join(CACHE_DIR, "risultati.json")
+
+# Mese e anno nel nome dei fogli Pivot (es. "Pivot 11-2024")
+_MESE_ANNO_RE = re.compile(r'(\d{2})-(\d{4})')
 
-def verifica_filtro_escludi(df, sheet_name):
+
+def verifica_filtro_escludi(righe, sheet_name):
     """
     Verifica che il filtro 'Escludi' sia correttamente impostato su '(blank)'.
     
+    Args:
+        righe: Lista di tuple con i valori delle celle del foglio
+        sheet_name: Nome del foglio
+    
     Returns:
         True se il filtro è corretto, False altrimenti
     """
-    # Cerca nelle prime 5 righe una cella con "Escludi" o "Escluso"
-    for idx in range(min(5, len(df))):
-        row = df.iloc[idx]
-        for col_idx, val in enumerate(row.values):
-            if pd.notna(val) and 'esclud' in str(val).lower():
-                # Trovato "Escludi/Escluso", verifica il valore del filtro
-                # Il valore del filtro dovrebbe essere nella colonna successiva
-                if col_idx + 1 < len(row):
-                    filtro_val = row.iloc[col_idx + 1]
-                    if pd.notna(filtro_val) and str(filtro_val).lower() == '(blank)':
-                        return True, None
-                    else:
-                        return False, f"Filtro 'Escludi' impostato su '{filtro_val}' invece di '(blank)'"
-                else:
-                    # Valore filtro non trovato, potrebbe essere nella stessa cella o non presente
-                    return False, "Valore del filtro 'Escludi' non trovato"
+    # Cerca nelle prime 5 righe la prima cella con "Escludi" o "Escluso"
+    trovato = next(((row, col_idx) for row in righe[:5] for col_idx, val in enumerate(row)
+                    if val is not None and 'esclud' in str(val).lower()), None)
+    
+    if trovato is None:
+        # Se non troviamo il campo Escludi, segnaliamo un warning ma continuiamo
+        return True, "Campo 'Escludi' non trovato nel foglio (potrebbe essere una struttura diversa)"
+    
+    # Trovato "Escludi/Escluso", verifica il valore del filtro
+    # Il valore del filtro dovrebbe essere nella colonna successiva
+    row, col_idx = trovato
+    if col_idx + 1 >= len(row):
+        # Valore filtro non trovato, potrebbe essere nella stessa cella o non presente
+        return False, "Valore del filtro 'Escludi' non trovato"
+    
+    filtro_val = row[col_idx + 1]
+    if filtro_val is not None and str(filtro_val).lower() == '(blank)':
+        return True, None
+    return False, f"Filtro 'Escludi' impostato su '{filtro_val}' invece di '(blank)'"
+
+
+def apri_excel(file_path):
+    """
+    Apre il file Excel in sola lettura: con python-calamine (parser nativo in Rust)
+    se installato, altrimenti con openpyxl.
+    
+    Returns:
+        Tupla (workbook, lista dei nomi dei fogli Pivot)
+    """
+    if CalamineWorkbook is not None:
+        wb = CalamineWorkbook.from_path(file_path)
+        nomi = wb.sheet_names
+    else:
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        nomi = wb.sheetnames
+    return wb, [s for s in nomi if s.lower().startswith('pivot')]
+
+
+def leggi_righe_foglio(wb, sheet_name):
+    """Legge tutte le righe di un foglio come lista di tuple di valori (celle vuote -> None)."""
+    if CalamineWorkbook is not None:
+        righe = wb.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False)
+        return [tuple(v if v != '' else None for v in riga) for riga in righe]
+    return list(wb[sheet_name].iter_rows(values_only=True))
+
+
+def leggi_righe_csv(cache_path):
+    """Legge le righe di un foglio dalla cache CSV (celle vuote -> None)."""
+    with open(cache_path, 'r', newline='', encoding='utf-8') as f:
+        return [tuple(v if v != '' else None for v in row) for row in csv.reader(f)]
+
+
+def _percorso_cache(sheet_name):
+    """Percorso del CSV in cache per un foglio (es. 'Pivot 11-2024' -> pivot_11-2024.csv)."""
+    return os.path.join(CACHE_DIR, sheet_name.lower().replace(' ', '_') + '.csv')
+
+
+def _ensure_csv_cache(file_path):
+    """
+    Aggiorna la cache CSV dei fogli Pivot. Se l'indice della cache si riferisce
+    a un'altra versione del file Excel (mtime diverso, anche più vecchio, es. un
+    backup ripristinato) tutti i fogli vengono rigenerati; altrimenti solo i mancanti.
+    
+    Returns:
+        Tupla (dizionario {nome foglio: percorso del CSV in cache},
+               dizionario {nome foglio: righe} dei fogli appena letti dall'Excel)
+    """
+    xlsx_mtime = os.path.getmtime(file_path)
+    
+    # Se l'indice corrisponde al file Excel attuale non serve nemmeno aprirlo
+    indice_valido = False
+    try:
+        with open(CACHE_INDICE, 'r', encoding='utf-8') as f:
+            indice = json.load(f)
+        indice_valido = indice['mtime'] == xlsx_mtime
+        # L'indice contiene solo i nomi dei file: i percorsi sono sempre sotto
+        # CACHE_DIR, anche se la cartella è stata copiata o spostata
+        fogli = {sheet_name: os.path.join(CACHE_DIR, os.path.basename(nome_file))
+                 for sheet_name, nome_file in indice['fogli'].items()}
+        if indice_valido and all(os.path.exists(p) for p in fogli.values()):
+            return fogli, {}
+    except (OSError, ValueError, KeyError):
+        pass
+    
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    
+    wb, pivot_sheets = apri_excel(file_path)
+    try:
+        fogli = {}
+        righe_lette = {}
+        for sheet_name in pivot_sheets:
+            cache_path = _percorso_cache(sheet_name)
+            if not indice_valido or not os.path.exists(cache_path):
+                righe_lette[sheet_name] = leggi_righe_foglio(wb, sheet_name)
+                with open(cache_path, 'w', newline='', encoding='utf-8') as f:
+                    csv.writer(f).writerows(righe_lette[sheet_name])
+            fogli[sheet_name] = cache_path
+    finally:
+        wb.close()
+    
+    with open(CACHE_INDICE, 'w', encoding='utf-8') as f:
+        json.dump({'mtime': xlsx_mtime,
+                   'fogli': {sheet_name: os.path.basename(p) for sheet_name, p in fogli.items()}},
+                  f, ensure_ascii=False, indent=2)
+    
+    return fogli, righe_lette
+
+
+def _chiave_cache_risultati(xlsx_mtime):
+    """
+    Chiave della cache dei dati estratti: mtime del file Excel più la firma
+    (blake2b) del sorgente di questo script, così una modifica all'estrazione
+    invalida la cache.
+    """
+    with open(__file__, 'rb') as f:
+        firma = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    return f"{xlsx_mtime}:{firma}"
+
+
+def _carica_cache_risultati(chiave):
+    """
+    Legge i dati estratti in un'esecuzione precedente, se riferiti alla
+    stessa chiave (vedi _chiave_cache_risultati).
+    
+    Returns:
+        Dizionario {nome foglio: [risultati, grand_total]} (vuoto se non valido)
+    """
+    if not USA_CACHE_CSV:
+        return {}
+    try:
+        with open(CACHE_RISULTATI, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache['chiave'] == chiave:
+            return cache['fogli']
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def _salva_cache_risultati(chiave, fogli):
+    """Salva i dati estratti per foglio, associati alla chiave della cache."""
+    if not USA_CACHE_CSV:
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(CACHE_RISULTATI, 'w', encoding='utf-8') as f:
+        json.dump({'chiave': chiave, 'fogli': fogli}, f, ensure_ascii=False)
+
+
+def _elimina_cache_risultati():
+    """Elimina la cache dei dati estratti (i fogli in cache sono stati rigenerati)."""
+    try:
+        os.remove(CACHE_RISULTATI)
+    except FileNotFoundError:
+        pass
+
+
+def carica_fogli_pivot():
+    """
+    Legge le righe di tutti i fogli Pivot, dalla cache CSV se aggiornata
+    oppure aprendo il file Excel una sola volta. Ogni foglio viene letto una
+    sola volta: quelli appena rigenerati in cache non vengono riletti dal CSV.
     
-    # Se non troviamo il campo Escludi, segnaliamo un warning ma continuiamo
-    return True, "Campo 'Escludi' non trovato nel foglio (potrebbe essere una struttura diversa)"
+    Returns:
+        Dizionario {nome foglio: lista di tuple con i valori delle celle}
+    """
+    if USA_CACHE_CSV:
+        cache, righe_lette = _ensure_csv_cache(FILE_PATH)
+        if righe_lette:
+            # Fogli riletti dall'Excel: i dati estratti in precedenza non valgono più
+            _elimina_cache_risultati()
+        return {sheet_name: righe_lette[sheet_name] if sheet_name in righe_lette else leggi_righe_csv(cache_path)
+                for sheet_name, cache_path in cache.items()}
+    
+    wb, pivot_sheets = apri_excel(FILE_PATH)
+    try:
+        return {sheet_name: leggi_righe_foglio(wb, sheet_name) for sheet_name in pivot_sheets}
+    finally:
+        wb.close()
 
 
-def verifica_tutti_i_filtri():
+def stampa_esito_filtri(errori, warnings, n_fogli):
     """
-    Verifica che tutti i fogli Pivot abbiano il filtro Escludi correttamente impostato.
+    Stampa l'esito della verifica del filtro Escludi sui fogli Pivot.
+    
+    Args:
+        errori: Messaggi dei fogli con filtro errato
+        warnings: Messaggi dei fogli senza campo Escludi
+        n_fogli: Numero di fogli Pivot verificati
     
     Returns:
         True se tutti i filtri sono corretti, False altrimenti
@@ -57,22 +250,6 @@ def verifica_tutti_i_filtri():
     print("VERIFICA FILTRI 'ESCLUDI'")
     print("=" * 70)
     
-    wb = load_workbook(FILE_PATH, read_only=True, data_only=True)
-    pivot_sheets = [s for s in wb.sheetnames if s.lower().startswith('pivot')]
-    wb.close()
-    
-    errori = []
-    warnings = []
-    
-    for sheet_name in pivot_sheets:
-        df = pd.read_excel(FILE_PATH, sheet_name=sheet_name, header=None)
-        ok, messaggio = verifica_filtro_escludi(df, sheet_name)
-        
-        if not ok:
-            errori.append(f"❌ {sheet_name}: {messaggio}")
-        elif messaggio:  # Warning
-            warnings.append(f"⚠️  {sheet_name}: {messaggio}")
-    
     # Mostra risultati
     if errori:
         print("\n🚫 ERRORI RILEVATI:")
@@ -95,96 +272,49 @@ def verifica_tutti_i_filtri():
         for warn in warnings:
             print(f"   {warn}")
     
-    print(f"\n✅ Tutti i {len(pivot_sheets)} fogli Pivot hanno il filtro 'Escludi' corretto")
+    print(f"\n✅ Tutti i {n_fogli} fogli Pivot hanno il filtro 'Escludi' corretto")
     return True
 
 
 def estrai_mese_anno(sheet_name):
     """Estrae mese e anno dal nome del foglio Pivot."""
     # Formato: "Pivot MM-YYYY"
-    match = re.search(r'(\d{2})-(\d{4})', sheet_name)
+    match = _MESE_ANNO_RE.search(sheet_name)
     if match:
-        mese = int(match.group(1))
-        anno = int(match.group(2))
-        return mese, anno
+        return int(match[1]), int(match[2])
     return None, None
 
 
-def estrai_dati_categoria(df):
-    """
-    Estrae le categorie, sottocategorie e importi da un foglio Pivot.
-    Gestisce la struttura gerarchica: Categoria -> Sottocategoria.
+def _to_float(importo):
+    """Converte un importo in float (0 se mancante o non numerico)."""
+    try:
+        return float(importo) if importo is not None else 0
+    except (ValueError, TypeError):
+        return 0
+
+
+def classifica_righe(importi, trattini):
     """
-    risultati = []
-    
-    # Trova la riga con l'intestazione (cerca "Categoria" o "Row Labels")
-    header_row = None
-    for idx, row in df.iterrows():
-        row_values = [str(v).lower() if pd.notna(v) else '' for v in row.values]
-        if 'categoria' in row_values or 'row labels' in row_values:
-            header_row = idx
-            break
+    Abbina ogni categoria alle sue sottocategorie basandosi solo sugli importi.
     
-    if header_row is None:
-        # Prova a cercare "Sum of Importo"
-        for idx, row in df.iterrows():
-            row_values = [str(v) if pd.notna(v) else '' for v in row.values]
-            if any('Sum of Importo' in v for v in row_values):
-                header_row = idx
-                break
+    Pattern: una categoria è seguita da sottocategorie fino alla prossima categoria;
+    le sottocategorie hanno importi che sommati danno l'importo della categoria.
     
-    if header_row is None:
-        return risultati, None
+    Args:
+        importi: Lista degli importi delle righe
+        trattini: Lista di bool, True se la riga è "-" (sottocategoria senza nome)
     
-    # Trova la colonna con gli importi
-    importo_col = 1  # Di default la seconda colonna
-    
-    grand_total = None
-    
-    # Raccogli tutte le righe con dati
-    rows_data = []
-    for idx in range(header_row + 1, len(df)):
-        row = df.iloc[idx]
-        nome = row.iloc[0] if pd.notna(row.iloc[0]) else None
-        
-        if nome is None or str(nome).strip() == '':
-            continue
-        
-        nome_str = str(nome).strip()
-        
-        if nome_str.lower() in ['nan', '(blank)']:
-            continue
-        
-        # Estrai l'importo
-        importo = row.iloc[importo_col] if importo_col < len(row) and pd.notna(row.iloc[importo_col]) else 0
-        
-        try:
-            importo_float = float(importo)
-        except (ValueError, TypeError):
-            importo_float = 0
-        
-        if nome_str.lower() == 'grand total':
-            grand_total = importo_float
-            break
-        
-        rows_data.append({
-            'nome': nome_str,
-            'importo': importo_float,
-            'idx': idx
-        })
-    
-    # Analizza la struttura categoria/sottocategoria
-    # Pattern: una categoria è seguita da sottocategorie fino alla prossima categoria
-    # Le sottocategorie hanno importi che sommati danno l'importo della categoria
+    Returns:
+        Lista di tuple (indice categoria, lista indici sottocategorie)
+    """
+    gruppi = []
     
     i = 0
-    while i < len(rows_data):
-        current = rows_data[i]
-        categoria_corrente = current['nome']
-        importo_categoria = current['importo']
+    while i < len(importi):
+        importo_categoria = importi[i]
         
         # Salta se è "-" (sottocategoria senza nome)
-        if categoria_corrente == '-':
+        if trattini[i]:
             i += 1
             continue
         
@@ -193,32 +323,91 @@ def estrai_dati_categoria(df):
         j = i + 1
         somma_sotto = 0
         
-        while j < len(rows_data):
-            next_row = rows_data[j]
-            
+        while j < len(importi):
             # Se troviamo una riga con "-" e stesso importo, è sottocategoria unica
-            if next_row['nome'] == '-' and abs(next_row['importo'] - importo_categoria) < 0.01:
+            if trattini[j] and abs(importi[j] - importo_categoria) < 0.01:
                 # Categoria con sottocategoria "-" (nessuna sottocategoria reale)
                 j += 1
                 break
             
             # Verifica se questa potrebbe essere una sottocategoria
             # Una sottocategoria ha un importo che contribuisce al totale della categoria
-            somma_sotto += next_row['importo']
+            somma_sotto += importi[j]
             
             # Se la somma delle sottocategorie si avvicina all'importo della categoria
             # siamo ancora dentro le sottocategorie
             if abs(somma_sotto - importo_categoria) < 0.01:
-                sottocategorie.append(next_row)
+                sottocategorie.append(j)
                 j += 1
                 break
             elif abs(somma_sotto) <= abs(importo_categoria) + 0.01:
-                sottocategorie.append(next_row)
+                sottocategorie.append(j)
                 j += 1
             else:
                 # Siamo andati oltre, questa è una nuova categoria
                 break
         
+        gruppi.append((i, sottocategorie))
+        i = j if sottocategorie else i + 1
+    
+    return gruppi
+
+
+def estrai_dati_categoria(righe):
+    """
+    Estrae le categorie, sottocategorie e importi da un foglio Pivot.
+    Gestisce la struttura gerarchica: Categoria -> Sottocategoria.
+    
+    Args:
+        righe: Lista di tuple con i valori delle celle del foglio
+    """
+    risultati = []
+    
+    # Trova la riga con l'intestazione (cerca "Categoria" o "Row Labels")
+    header_row = next((idx for idx, row in enumerate(righe)
+                       if any(str(v).lower() in ('categoria', 'row labels') for v in row if v is not None)),
+                      None)
+    
+    if header_row is None:
+        # Prova a cercare "Sum of Importo"
+        header_row = next((idx for idx, row in enumerate(righe)
+                           if any('Sum of Importo' in str(v) for v in row if v is not None)),
+                          None)
+    
+    if header_row is None:
+        return risultati, None
+    
+    # Trova la colonna con gli importi
+    importo_col = 1  # Di default la seconda colonna
+    
+    grand_total = None
+    
+    # Estrai una sola volta le colonne nome e importo sotto l'intestazione
+    corpo = righe[header_row + 1:]
+    nomi_col = [str(row[0]).strip() if row and row[0] is not None else '' for row in corpo]
+    importi_col = [row[importo_col] if importo_col < len(row) else None for row in corpo]
+    
+    # La tabella termina al Grand Total
+    nomi_lower = [nome.lower() for nome in nomi_col]
+    fine = nomi_lower.index('grand total') if 'grand total' in nomi_lower else len(corpo)
+    
+    if fine < len(corpo):
+        grand_total = _to_float(importi_col[fine])
+    
+    # Tieni solo le righe con dati (nome valido), come liste parallele
+    validi = [k for k in range(fine) if nomi_col[k] and nomi_lower[k] not in ('nan', '(blank)')]
+    nomi = [nomi_col[k] for k in validi]
+    # float() per cella: le celle lette dalla cache CSV sono stringhe e devono
+    # dare esattamente lo stesso float delle celle lette dall'Excel
+    importi = [_to_float(importi_col[k]) for k in validi]
+    
+    # Analizza la struttura categoria/sottocategoria (solo sugli importi)
+    trattini = [nome == '-' for nome in nomi]
+    
+    for i, sottocategorie in classifica_righe(importi, trattini):
+        categoria_corrente = nomi[i]
+        importo_categoria = importi[i]
+        
         # Classifica come entrata o uscita
         if importo_categoria >= 0:
             tipo = 'entrata'
@@ -226,16 +415,15 @@ def estrai_dati_categoria(df):
             tipo = 'uscita'
         
         # Se abbiamo sottocategorie, aggiungi ogni sottocategoria con la sua categoria
-        if sottocategorie and len(sottocategorie) > 0:
-            for sotto in sottocategorie:
-                if sotto['nome'] != '-':
+        if sottocategorie:
+            for k in sottocategorie:
+                if not trattini[k]:
                     risultati.append({
                         'categoria': categoria_corrente,
-                        'sottocategoria': sotto['nome'],
-                        'importo': sotto['importo'],
+                        'sottocategoria': nomi[k],
+                        'importo': importi[k],
                         'tipo': tipo
                     })
-            i = j
         else:
             # Nessuna sottocategoria, aggiungi solo la categoria
             risultati.append({
@@ -244,119 +432,142 @@ def estrai_dati_categoria(df):
                 'importo': importo_categoria,
                 'tipo': tipo
             })
-            i += 1
     
     return risultati, grand_total
 
 
-def elabora_tutti_i_pivot():
-    """Elabora tutti i fogli Pivot e crea un dataset consolidato."""
+def elabora_tutti_i_pivot(fogli):
+    """
+    Elabora tutti i fogli Pivot e crea un dataset consolidato.
+    
+    Il filtro Escludi viene verificato sulle righe già lette, prima di scrivere
+    qualsiasi file. Il dettaglio per categoria viene scritto su CSV_DETTAGLIO un
+    mese alla volta; in memoria resta solo il riepilogo mensile.
+    
+    Returns:
+        Riepilogo mensile per colonne, oppure None se qualche filtro è errato
+    """
+    
+    # Verifica filtri e fogli in ordine cronologico (il dettaglio esce già ordinato per data)
+    errori = []
+    warnings = []
+    fogli_datati = []
+    for sheet_name, righe in fogli.items():
+        ok, messaggio = verifica_filtro_escludi(righe, sheet_name)
+        if not ok:
+            errori.append(f"❌ {sheet_name}: {messaggio}")
+        elif messaggio:  # Warning
+            warnings.append(f"⚠️  {sheet_name}: {messaggio}")
+        
+        mese, anno = estrai_mese_anno(sheet_name)
+        if mese is None:
+            print(f"⚠️  Impossibile estrarre data da: {sheet_name}")
+            continue
+        fogli_datati.append((anno, mese, sheet_name))
+    fogli_datati.sort()
+    
+    if not stampa_esito_filtri(errori, warnings, len(fogli)):
+        return None
     
     print("=" * 70)
     print("ESTRAZIONE DATI FLUSSI DI CASSA")
     print("=" * 70)
     
-    # Carica il workbook per ottenere i nomi dei fogli
-    wb = load_workbook(FILE_PATH, read_only=True, data_only=True)
-    pivot_sheets = [s for s in wb.sheetnames if s.lower().startswith('pivot')]
-    wb.close()
+    print(f"\n📊 Fogli Pivot trovati: {len(fogli)}")
     
-    print(f"\n📊 Fogli Pivot trovati: {len(pivot_sheets)}")
+    # Dati già estratti in un'esecuzione precedente (stesso Excel e stesso codice)
+    chiave_cache = _chiave_cache_risultati(os.path.getmtime(FILE_PATH))
+    cache_risultati = _carica_cache_risultati(chiave_cache)
+    cache_aggiornata = False
     
-    # Lista per accumulare tutti i dati
-    dati_consolidati = []
-    riepilogo_mensile = []
+    # Riepilogo accumulato per colonne (una lista per campo)
+    riepilogo = {'data': [], 'data_label': [], 'mese': [], 'anno': [],
+                 'totale_entrate': [], 'totale_uscite': [], 'saldo': []}
     
-    for sheet_name in sorted(pivot_sheets):
-        mese, anno = estrai_mese_anno(sheet_name)
-        if mese is None:
-            print(f"⚠️  Impossibile estrarre data da: {sheet_name}")
-            continue
-        
-        # Crea stringa data per ordinamento
-        data_str = f"{anno}-{mese:02d}"
-        data_label = f"{mese:02d}/{anno}"
-        
-        print(f"\n🔄 Elaborazione: {sheet_name} ({data_label})")
-        
-        # Leggi il foglio
-        df = pd.read_excel(FILE_PATH, sheet_name=sheet_name, header=None)
-        
-        # Estrai le categorie e il Grand Total
-        risultati, grand_total = estrai_dati_categoria(df)
+    with open(CSV_DETTAGLIO, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f, lineterminator=os.linesep)
+        writer.writerow(COLONNE_DETTAGLIO)
         
-        totale_entrate = 0
-        totale_uscite = 0
-        
-        for item in risultati:
-            # Aggiungi ai dati consolidati con categoria e sottocategoria
-            dati_consolidati.append({
-                'data': data_str,
-                'data_label': data_label,
-                'mese': mese,
-                'anno': anno,
-                'categoria': item['categoria'],
-                'sottocategoria': item.get('sottocategoria'),
-                'importo': item['importo'],
-                'tipo': item['tipo']
-            })
+        for anno, mese, sheet_name in fogli_datati:
+            # Crea stringa data per ordinamento
+            data_str = f"{anno}-{mese:02d}"
+            data_label = f"{mese:02d}/{anno}"
+            
+            print(f"\n🔄 Elaborazione: {sheet_name} ({data_label})")
             
-            if item['tipo'] == 'entrata':
-                totale_entrate += item['importo']
+            # Estrai le categorie e il Grand Total (o riusa quelli in cache)
+            if sheet_name in cache_risultati:
+                risultati, grand_total = cache_risultati[sheet_name]
             else:
-                totale_uscite += item['importo']
-        
-        # Usa il Grand Total dalla Pivot se disponibile, altrimenti calcola
-        if grand_total is not None:
-            saldo = grand_total
-        else:
-            saldo = totale_entrate + totale_uscite
-        
-        # Riepilogo mensile
-        riepilogo_mensile.append({
-            'data': data_str,
-            'data_label': data_label,
-            'mese': mese,
-            'anno': anno,
-            'totale_entrate': round(totale_entrate, 2),
-            'totale_uscite': round(totale_uscite, 2),
-            'saldo': round(saldo, 2)
-        })
-        
-        print(f"   ✅ Voci estratte: {len(risultati)}")
-        print(f"   💰 Entrate: €{totale_entrate:,.2f} | Uscite: €{totale_uscite:,.2f} | Saldo: €{saldo:,.2f}")
+                risultati, grand_total = estrai_dati_categoria(fogli[sheet_name])
+                cache_risultati[sheet_name] = [risultati, grand_total]
+                cache_aggiornata = True
+            
+            totale_entrate = 0
+            totale_uscite = 0
+            
+            for item in risultati:
+                if item['tipo'] == 'entrata':
+                    totale_entrate += item['importo']
+                else:
+                    totale_uscite += item['importo']
+            
+            # Righe del mese ordinate per categoria (ordinamento stabile)
+            risultati.sort(key=lambda item: item['categoria'])
+            writer.writerows(
+                (data_str, data_label, mese, anno, item['categoria'],
+                 item.get('sottocategoria'), item['importo'], item['tipo'])
+                for item in risultati
+            )
+            
+            # Usa il Grand Total dalla Pivot se disponibile, altrimenti calcola
+            if grand_total is not None:
+                saldo = grand_total
+            else:
+                saldo = totale_entrate + totale_uscite
+            
+            # Riepilogo mensile
+            riepilogo['data'].append(data_str)
+            riepilogo['data_label'].append(data_label)
+            riepilogo['mese'].append(mese)
+            riepilogo['anno'].append(anno)
+            riepilogo['totale_entrate'].append(round(totale_entrate, 2))
+            riepilogo['totale_uscite'].append(round(totale_uscite, 2))
+            riepilogo['saldo'].append(round(saldo, 2))
+            
+            print(f"   ✅ Voci estratte: {len(risultati)}")
+            print(f"   💰 Entrate: €{totale_entrate:,.2f} | Uscite: €{totale_uscite:,.2f} | Saldo: €{saldo:,.2f}")
     
-    return dati_consolidati, riepilogo_mensile
+    if cache_aggiornata:
+        _salva_cache_risultati(chiave_cache, cache_risultati)
+    
+    return riepilogo
 
 
-def salva_risultati(dati_consolidati, riepilogo_mensile):
+def salva_risultati(riepilogo):
     """Salva i risultati in vari formati."""
     
     print("\n" + "=" * 70)
     print("SALVATAGGIO RISULTATI")
     print("=" * 70)
     
-    # Crea DataFrame
-    df_dettaglio = pd.DataFrame(dati_consolidati)
-    df_riepilogo = pd.DataFrame(riepilogo_mensile)
-    
-    # Ordina per data
-    if not df_dettaglio.empty:
-        df_dettaglio = df_dettaglio.sort_values(['data', 'categoria'])
-    if not df_riepilogo.empty:
-        df_riepilogo = df_riepilogo.sort_values('data')
-    
-    # Salva CSV - Dettaglio per categoria
-    csv_dettaglio = os.path.join(SCRIPT_DIR, "flussi_cassa_dettaglio.csv")
-    df_dettaglio.to_csv(csv_dettaglio, index=False, encoding='utf-8-sig')
-    print(f"\n💾 Dettaglio categorie: {csv_dettaglio}")
-    
-    # Salva CSV - Riepilogo mensile
-    csv_riepilogo = os.path.join(SCRIPT_DIR, "flussi_cassa_riepilogo.csv")
-    df_riepilogo.to_csv(csv_riepilogo, index=False, encoding='utf-8-sig')
-    print(f"💾 Riepilogo mensile: {csv_riepilogo}")
-    
-    # Salva JSON strutturato
+    # Il dettaglio è già stato scritto (ordinato) da elabora_tutti_i_pivot:
+    # si rilegge per JSON e analisi ('tipo' e 'categoria' come category:
+    # groupby e ordinamenti lavorano sui codici interi). 'round_trip' rilegge
+    # gli importi esattamente come sono stati scritti.
+    df_dettaglio = pd.read_csv(CSV_DETTAGLIO, encoding='utf-8-sig', float_precision='round_trip', dtype={
+        'data': str, 'data_label': str, 'mese': 'int8', 'anno': 'int16',
+        'categoria': 'category', 'sottocategoria': object,
+        'importo': 'float64', 'tipo': 'category'})
+    print(f"\n💾 Dettaglio categorie: {CSV_DETTAGLIO}")
+    
+    # Riepilogo mensile, già in ordine di data
+    df_riepilogo = pd.DataFrame(riepilogo, copy=False).astype(
+        {'mese': 'int8', 'anno': 'int16'})
+    df_riepilogo.to_csv(CSV_RIEPILOGO, index=False, encoding='utf-8-sig')
+    print(f"💾 Riepilogo mensile: {CSV_RIEPILOGO}")
+    
+    # Salva JSON strutturato (indentato, leggibile)
     json_output = {
         'generato_il': datetime.now().isoformat(),
         'periodo': {
@@ -366,11 +577,9 @@ def salva_risultati(dati_consolidati, riepilogo_mensile):
         'riepilogo_mensile': df_riepilogo.to_dict('records'),
         'dettaglio_categorie': df_dettaglio.to_dict('records')
     }
-    
-    json_path = os.path.join(SCRIPT_DIR, "flussi_cassa.json")
-    with open(json_path, 'w', encoding='utf-8') as f:
+    with open(JSON_OUTPUT, 'w', encoding='utf-8') as f:
         json.dump(json_output, f, ensure_ascii=False, indent=2)
-    print(f"💾 JSON completo: {json_path}")
+    print(f"💾 JSON completo: {JSON_OUTPUT}")
     
     return df_dettaglio, df_riepilogo
 
@@ -414,19 +623,21 @@ def stampa_analisi(df_dettaglio, df_riepilogo):
     
     # Top categorie di spesa (uscite)
     if not df_dettaglio.empty:
-        df_uscite = df_dettaglio[df_dettaglio['tipo'] == 'uscita']
-        if not df_uscite.empty:
-            top_uscite = df_uscite.groupby('categoria')['importo'].sum().sort_values()
+        # Un solo raggruppamento per tipo e categoria, poi si seleziona il tipo
+        totali = df_dettaglio.groupby(['tipo', 'categoria'], sort=False, observed=True)['importo'].sum()
+        tipi = totali.index.get_level_values('tipo')
+        
+        if 'uscita' in tipi:
+            top_uscite = totali.loc['uscita'].sort_values().head(5)
             print(f"\n🔻 TOP 5 CATEGORIE DI SPESA:")
-            for cat, importo in top_uscite.head(5).items():
+            for cat, importo in top_uscite.items():
                 print(f"   {cat:30} €{importo:>12,.2f}")
         
         # Top categorie di entrata
-        df_entrate = df_dettaglio[df_dettaglio['tipo'] == 'entrata']
-        if not df_entrate.empty:
-            top_entrate = df_entrate.groupby('categoria')['importo'].sum().sort_values(ascending=False)
+        if 'entrata' in tipi:
+            top_entrate = totali.loc['entrata'].sort_values(ascending=False).head(5)
             print(f"\n🔺 TOP 5 CATEGORIE DI ENTRATA:")
-            for cat, importo in top_entrate.head(5).items():
+            for cat, importo in top_entrate.items():
                 print(f"   {cat:30} €{importo:>12,.2f}")
     
     # Tabella riepilogo mensile
@@ -434,24 +645,26 @@ def stampa_analisi(df_dettaglio, df_riepilogo):
     print("-" * 70)
     print(f"{'Mese':<12} {'Entrate':>15} {'Uscite':>15} {'Saldo':>15}")
     print("-" * 70)
-    for _, row in df_riepilogo.iterrows():
-        print(f"{row['data_label']:<12} €{row['totale_entrate']:>13,.2f} €{row['totale_uscite']:>13,.2f} €{row['saldo']:>13,.2f}")
+    for data_label, entrate, uscite, saldo in zip(df_riepilogo['data_label'], df_riepilogo['totale_entrate'],
+                                                 df_riepilogo['totale_uscite'], df_riepilogo['saldo']):
+        print(f"{data_label:<12} €{entrate:>13,.2f} €{uscite:>13,.2f} €{saldo:>13,.2f}")
     print("-" * 70)
 
 
 def main():
     """Funzione principale."""
     
-    # STEP 0: Verifica filtri Escludi
-    if not verifica_tutti_i_filtri():
+    # Leggi una sola volta tutti i fogli Pivot
+    fogli = carica_fogli_pivot()
+    
+    # Verifica filtri Escludi ed estrai i dati in un solo passaggio sui fogli
+    riepilogo = elabora_tutti_i_pivot(fogli)
+    if riepilogo is None:
         print("\n⛔ Script terminato a causa di errori nei filtri.")
         sys.exit(1)
     
-    # Estrai i dati
-    dati_consolidati, riepilogo_mensile = elabora_tutti_i_pivot()
-    
     # Salva i risultati
-    df_dettaglio, df_riepilogo = salva_risultati(dati_consolidati, riepilogo_mensile)
+    df_dettaglio, df_riepilogo = salva_risultati(riepilogo)
     
     # Stampa analisi
     stampa_analisi(df_dettaglio, df_riepilogo)
@@ -5,13 +5,26 @@ Eseguire dopo aver lanciato estrai_flussi_cassa.py
 Uso: python genera_grafici.py
 """
 
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # Solo salvataggio su file: nessun backend interattivo
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+import hashlib
+import json
 import os
 import glob
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # Opzionale: senza pyarrow i CSV vengono letti da pandas
+    pa = None
+
 # Directory dello script (per path relativi)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -20,8 +33,33 @@ CSV_RIEPILOGO = os.path.join(SCRIPT_DIR, "flussi_cassa_riepilogo.csv")
 CSV_DETTAGLIO = os.path.join(SCRIPT_DIR, "flussi_cassa_dettaglio.csv")
 OUTPUT_DIR = os.path.join(SCRIPT_DIR, "grafici")
 
+# Firme dei dati di ogni grafico: un grafico già presente con la stessa firma non viene ridisegnato
+FILE_FIRME = os.path.join(OUTPUT_DIR, ".firme_grafici.json")
+RIGENERA_GRAFICI = False  # True: elimina e ridisegna sempre tutti i grafici
+
+# Colonne lette dai CSV e relativi tipi (le colonne non usate non vengono caricate).
+# Gli importi restano float64: le statistiche sono stampate al centesimo e con
+# float32 (~7 cifre significative) già il totale delle entrate sbaglia di 1 centesimo.
+DTYPE_RIEPILOGO = {
+    'data': 'str', 'data_label': 'str',
+    'totale_entrate': 'float64', 'totale_uscite': 'float64', 'saldo': 'float64',
+}
+DTYPE_DETTAGLIO = {
+    'data': 'str', 'data_label': 'str',
+    'tipo': 'category', 'categoria': 'category', 'sottocategoria': 'category',
+    'importo': 'float64',
+}
+
 # Stile grafici
 plt.style.use('seaborn-v0_8-whitegrid')
+# Solo esportazione PNG: path semplificati e senza hinting del testo riducono il lavoro di Agg
+plt.rcParams.update({
+    'path.simplify': True,
+    'path.simplify_threshold': 1.0,
+    'agg.path.chunksize': 10000,
+    'text.hinting': 'none',
+    'figure.max_open_warning': 0,
+})
 COLORS = {
     'entrate': '#2ecc71',
     'uscite': '#e74c3c', 
@@ -30,6 +68,9 @@ COLORS = {
     'saldo_negativo': '#c0392b'
 }
 
+# Caratteri da sostituire/eliminare nei nomi file dei grafici per categoria
+_NOME_FILE_SICURO = str.maketrans({' ': '_', ',': None, '/': '_'})
+
 # Colori distinti per le categorie di spesa
 CATEGORY_COLORS = [
     '#e74c3c',  # Rosso
@@ -51,12 +92,15 @@ CATEGORY_COLORS = [
 
 
 def elimina_grafici_vecchi():
-    """Elimina tutti i grafici esistenti prima di generare i nuovi."""
+    """Elimina i grafici esistenti prima di generare i nuovi."""
     print("\n🗑️  Pulizia grafici esistenti...")
     
     if os.path.exists(OUTPUT_DIR):
-        # Elimina tutti i file .png nella cartella grafici
-        files_png = glob.glob(os.path.join(OUTPUT_DIR, "*.png"))
+        # Elimina i file .png nella cartella grafici, tranne i grafici aggregati
+        # (agg_*.png) che sono gestiti da genera_report.py e possono essere
+        # generati in parallelo a questo script
+        files_png = [f for f in glob.glob(os.path.join(OUTPUT_DIR, "*.png"))
+                     if not os.path.basename(f).startswith("agg_")]
         for f in files_png:
             try:
                 os.remove(f)
@@ -76,49 +120,143 @@ def elimina_grafici_vecchi():
         print("   ℹ️  Cartella grafici non esistente, verrà creata")
 
 
+def firma_grafico(*dati):
+    """
+    Calcola la firma (blake2b) dei dati usati per disegnare un grafico.
+    Include il sorgente di questo script, così una modifica al codice dei
+    grafici invalida tutte le firme.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(__file__, 'rb') as f:
+        h.update(f.read())
+    for d in dati:
+        if isinstance(d, (pd.DataFrame, pd.Series)):
+            h.update(repr(d.columns if isinstance(d, pd.DataFrame) else d.name).encode())
+            h.update(pd.util.hash_pandas_object(d).to_numpy().tobytes())
+        else:
+            h.update(repr(d).encode())
+    return h.hexdigest()
+
+
+def carica_firme():
+    """Carica le firme dei grafici dell'esecuzione precedente ({nome file: firma})."""
+    if RIGENERA_GRAFICI:
+        return {}
+    try:
+        with open(FILE_FIRME, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def grafico_invariato(filename, firma, firme_precedenti):
+    """True se il grafico esiste già ed è stato disegnato con gli stessi dati."""
+    return (firme_precedenti.get(filename) == firma
+            and os.path.exists(os.path.join(OUTPUT_DIR, filename)))
+
+
+def elimina_grafici_obsoleti(firme):
+    """Elimina i grafici rimasti da esecuzioni precedenti che non sono più generati."""
+    # I grafici aggregati (agg_*.png) sono gestiti da genera_report.py
+    obsoleti = [f for f in glob.glob(os.path.join(OUTPUT_DIR, "*.png"))
+                if os.path.basename(f) not in firme
+                and not os.path.basename(f).startswith("agg_")]
+    for f in obsoleti:
+        try:
+            os.remove(f)
+        except Exception as e:
+            print(f"   ⚠️ Errore eliminando {f}: {e}")
+    
+    if obsoleti:
+        print(f"\n🗑️  Eliminati {len(obsoleti)} grafici obsoleti")
+
+
+def leggi_csv(path, dtype):
+    """
+    Legge un CSV caricando solo le colonne in dtype, con i tipi indicati.
+    Se pyarrow è installato usa il suo lettore multithread, altrimenti pandas.
+    """
+    if pa is None:
+        return pd.read_csv(path, engine='c', dtype=dtype, float_precision='round_trip',
+                           usecols=lambda col: col in dtype)
+    
+    # Le colonne category diventano dizionari Arrow, convertiti da to_pandas in Categorical
+    tipi_arrow = {'str': pa.string(), 'float64': pa.float64(),
+                  'category': pa.dictionary(pa.int32(), pa.string())}
+    opzioni = pa_csv.ConvertOptions(
+        column_types={col: tipi_arrow[tipo] for col, tipo in dtype.items()},
+        include_columns=list(dtype),
+        strings_can_be_null=True,  # celle vuote -> NaN, come in pandas
+    )
+    df = pa_csv.read_csv(path, convert_options=opzioni).to_pandas()
+    
+    # Categorie in ordine alfabetico come con pandas (Arrow le tiene in ordine di apparizione)
+    for col, tipo in dtype.items():
+        if tipo == 'category':
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+    return df
+
+
 def carica_dati():
-    """Carica i dati dai file CSV."""
+    """
+    Carica i dati dai file CSV.
+    
+    Returns:
+        Tupla (df_riepilogo, df_dettaglio, df_uscite) dove df_uscite contiene
+        solo le uscite, con importo in valore assoluto e importo_netto con segno
+    """
     print("📂 Caricamento dati...")
     
-    df_riepilogo = pd.read_csv(CSV_RIEPILOGO)
-    df_dettaglio = pd.read_csv(CSV_DETTAGLIO)
+    # Tipi espliciti: niente inferenza, e le colonne testuali ripetute sono
+    # category (confronti e groupby sui codici interi)
+    df_riepilogo = leggi_csv(CSV_RIEPILOGO, DTYPE_RIEPILOGO)
+    df_dettaglio = leggi_csv(CSV_DETTAGLIO, DTYPE_DETTAGLIO)
     
-    # Converti la colonna data in datetime per ordinamento
-    df_riepilogo['data_dt'] = pd.to_datetime(df_riepilogo['data'] + '-01')
+    # Converti la colonna data (AAAA-MM) in datetime per ordinamento
+    df_riepilogo['data_dt'] = pd.PeriodIndex(df_riepilogo['data'], freq='M').to_timestamp()
     df_riepilogo = df_riepilogo.sort_values('data_dt')
     
-    df_dettaglio['data_dt'] = pd.to_datetime(df_dettaglio['data'] + '-01')
+    df_dettaglio['data_dt'] = pd.PeriodIndex(df_dettaglio['data'], freq='M').to_timestamp()
     df_dettaglio = df_dettaglio.sort_values('data_dt')
     
+    # Uscite filtrate una sola volta e condivise da tutti i grafici e dal report:
+    # filtro, valore assoluto e importo con segno in un'unica nuova tabella
+    mask_uscita = df_dettaglio['tipo'].eq('uscita').to_numpy()
+    importi_uscita = df_dettaglio['importo'].to_numpy()[mask_uscita]
+    df_uscite = df_dettaglio[mask_uscita].assign(importo=np.abs(importi_uscita),
+                                                 importo_netto=importi_uscita)
+    
     print(f"   ✅ Riepilogo: {len(df_riepilogo)} mesi")
     print(f"   ✅ Dettaglio: {len(df_dettaglio)} record")
     
-    return df_riepilogo, df_dettaglio
+    return df_riepilogo, df_dettaglio, df_uscite
 
 
 def grafico_andamento_mensile(df):
     """Grafico 1: Andamento entrate, uscite e saldo nel tempo."""
     
-    fig, ax = plt.subplots(figsize=(14, 7))
+    fig = Figure(figsize=(14, 7))
+    ax = fig.subplots()
     
-    x = range(len(df))
+    x = np.arange(len(df))
+    saldi = df['saldo'].to_numpy()
     
     # Barre per entrate e uscite
     width = 0.35
-    bars_entrate = ax.bar([i - width/2 for i in x], df['totale_entrate'], 
+    bars_entrate = ax.bar(x - width/2, df['totale_entrate'].to_numpy(), 
                           width, label='Entrate', color=COLORS['entrate'], alpha=0.8)
-    bars_uscite = ax.bar([i + width/2 for i in x], df['totale_uscite'].abs(), 
+    bars_uscite = ax.bar(x + width/2, np.abs(df['totale_uscite'].to_numpy()), 
                          width, label='Uscite', color=COLORS['uscite'], alpha=0.8)
     
     # Linea per il saldo
     ax2 = ax.twinx()
-    line_saldo = ax2.plot(x, df['saldo'], 'o-', color=COLORS['saldo'], 
+    line_saldo = ax2.plot(x, saldi, 'o-', color=COLORS['saldo'], 
                           linewidth=2.5, markersize=8, label='Saldo')
     
-    # Evidenzia saldo negativo
-    for i, saldo in enumerate(df['saldo']):
-        if saldo < 0:
-            ax2.plot(i, saldo, 'o', color=COLORS['saldo_negativo'], markersize=12, zorder=5)
+    # Evidenzia saldo negativo (un solo artist per tutti i punti)
+    negativi = np.flatnonzero(saldi < 0)
+    if len(negativi):
+        ax2.plot(negativi, saldi[negativi], 'o', color=COLORS['saldo_negativo'], markersize=12, zorder=5)
     
     # Linea zero per saldo
     ax2.axhline(y=0, color='gray', linestyle='--', alpha=0.5)
@@ -139,35 +277,33 @@ def grafico_andamento_mensile(df):
     ax.set_title('Andamento Flussi di Cassa Mensili', fontsize=14, fontweight='bold')
     
     # Aggiungi valori sopra le barre del saldo
-    for i, (_, row) in enumerate(df.iterrows()):
-        color = COLORS['saldo_positivo'] if row['saldo'] >= 0 else COLORS['saldo_negativo']
-        ax2.annotate(f"€{row['saldo']:,.0f}", 
-                     xy=(i, row['saldo']), 
+    colori_saldo = np.where(saldi >= 0, COLORS['saldo_positivo'], COLORS['saldo_negativo'])
+    for i, (saldo, color) in enumerate(zip(saldi, colori_saldo)):
+        ax2.annotate(f"€{saldo:,.0f}", 
+                     xy=(i, saldo), 
                      xytext=(0, 10), textcoords='offset points',
                      ha='center', fontsize=8, color=color, fontweight='bold')
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
 
-def grafico_categorie_spesa(df_dettaglio):
+def grafico_categorie_spesa(totali_categorie):
     """Grafico 3: Composizione delle spese per categoria con colori distinti."""
     
-    # Filtra solo uscite e raggruppa per categoria
-    df_uscite = df_dettaglio[df_dettaglio['tipo'] == 'uscita'].copy()
-    df_uscite['importo'] = df_uscite['importo'].abs()
+    # Totali delle uscite per categoria
+    categorie = totali_categorie['importo']
     
-    categorie = df_uscite.groupby('categoria')['importo'].sum().sort_values(ascending=False)
-    
-    # Raggruppa categorie piccole in "Altro"
+    # Raggruppa categorie piccole in "Altro" (si ordinano solo le principali)
     threshold = categorie.sum() * 0.03  # 3% del totale
-    categorie_principali = categorie[categorie >= threshold]
+    categorie_principali = categorie[categorie >= threshold].sort_values(ascending=False)
     altre = categorie[categorie < threshold].sum()
     
     if altre > 0:
         categorie_principali['Altro'] = altre
     
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 7))
+    fig = Figure(figsize=(16, 7))
+    ax1, ax2 = fig.subplots(1, 2)
     
     # Usa colori distinti invece di sfumature
     colors = CATEGORY_COLORS[:len(categorie_principali)]
@@ -194,32 +330,26 @@ def grafico_categorie_spesa(df_dettaglio):
     for i, v in enumerate(categorie_principali.values):
         ax2.text(v + 100, i, f'€{v:,.0f}', va='center', fontsize=9)
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
 
-def grafico_trend_categorie(df_dettaglio):
+def grafico_trend_categorie(df_riepilogo, df_uscite, totali_categorie):
     """Grafico 4: Trend delle principali categorie di spesa nel tempo."""
     
-    df_uscite = df_dettaglio[df_dettaglio['tipo'] == 'uscita'].copy()
-    df_uscite['importo'] = df_uscite['importo'].abs()
-    
     # Trova le top 5 categorie per totale speso
-    top_categorie = df_uscite.groupby('categoria')['importo'].sum().nlargest(5).index
-    
-    # Pivot per avere mesi come colonne e categorie come righe
-    df_pivot = df_uscite[df_uscite['categoria'].isin(top_categorie)].pivot_table(
-        index='data_label', 
-        columns='categoria', 
-        values='importo', 
-        aggfunc='sum',
-        fill_value=0
-    )
+    top_categorie = totali_categorie['importo'].nlargest(5).index
+    
+    # Mesi come righe e categorie come colonne
+    df_pivot = (df_uscite[df_uscite['categoria'].isin(top_categorie)]
+                .groupby(['data_label', 'categoria'], observed=True, sort=False)['importo'].sum()
+                .unstack('categoria', fill_value=0))
     
-    # Riordina per data
-    df_pivot = df_pivot.reindex(df_dettaglio['data_label'].unique())
+    # Riordina per data (il riepilogo ha già un mese per riga, in ordine)
+    df_pivot = df_pivot.reindex(df_riepilogo['data_label'].to_numpy())
     
-    fig, ax = plt.subplots(figsize=(14, 7))
+    fig = Figure(figsize=(14, 7))
+    ax = fig.subplots()
     
     for i, cat in enumerate(top_categorie):
         if cat in df_pivot.columns:
@@ -231,32 +361,14 @@ def grafico_trend_categorie(df_dettaglio):
     ax.set_title('Trend delle Principali Categorie di Spesa', fontsize=14, fontweight='bold')
     ax.legend(loc='upper left', bbox_to_anchor=(1.02, 1))
     
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
+    for etichetta in ax.get_xticklabels():
+        etichetta.set(rotation=45, ha='right')
+    fig.tight_layout()
     return fig
 
 
-def grafico_singola_categoria_spesa(df_dettaglio, categoria, sottocategoria=None, color_idx=0):
-    """Genera un grafico per una singola categoria/sottocategoria di spesa nel tempo."""
-    
-    # Filtra per categoria
-    df_cat = df_dettaglio[(df_dettaglio['tipo'] == 'uscita') & 
-                          (df_dettaglio['categoria'] == categoria)].copy()
-    
-    # Se specificata una sottocategoria, filtra anche per quella
-    if sottocategoria is not None:
-        df_cat = df_cat[df_cat['sottocategoria'] == sottocategoria]
-    
-    if df_cat.empty:
-        return None
-    
-    df_cat['importo'] = df_cat['importo'].abs()
-    
-    # Raggruppa per mese
-    df_mensile = df_cat.groupby(['data_label', 'data_dt'])['importo'].sum().reset_index()
-    df_mensile = df_mensile.sort_values('data_dt')
-    
-    fig, ax = plt.subplots(figsize=(12, 5))
+def _disegna_singola_categoria(ax, df_mensile, categoria, sottocategoria, color_idx):
+    """Disegna il grafico di una categoria/sottocategoria sugli assi indicati."""
     
     x = range(len(df_mensile))
     color = CATEGORY_COLORS[color_idx % len(CATEGORY_COLORS)]
@@ -273,9 +385,7 @@ def grafico_singola_categoria_spesa(df_dettaglio, categoria, sottocategoria=None
                label=f'Media: €{media:,.0f}')
     
     # Etichette valori
-    for i, v in enumerate(df_mensile['importo']):
-        ax.annotate(f'€{v:,.0f}', xy=(i, v), xytext=(0, 5), 
-                    textcoords='offset points', ha='center', fontsize=8)
+    ax.bar_label(bars, labels=[f'€{v:,.0f}' for v in df_mensile['importo']], padding=5, fontsize=8)
     
     ax.set_xlabel('Mese', fontsize=12)
     ax.set_ylabel('Importo (€)', fontsize=12)
@@ -299,8 +409,7 @@ def grafico_singola_categoria_spesa(df_dettaglio, categoria, sottocategoria=None
     ax.text(0.02, 0.98, stats_text, transform=ax.transAxes, fontsize=10,
             verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
     
-    plt.tight_layout()
-    return fig
+    ax.figure.tight_layout()
 
 
 def grafico_stipendi(df_dettaglio):
@@ -318,7 +427,8 @@ def grafico_stipendi(df_dettaglio):
     df_mensile = df_lavoro.groupby(['data_label', 'data_dt'])['importo'].sum().reset_index()
     df_mensile = df_mensile.sort_values('data_dt')
     
-    fig, ax = plt.subplots(figsize=(14, 6))
+    fig = Figure(figsize=(14, 6))
+    ax = fig.subplots()
     
     x = range(len(df_mensile))
     
@@ -335,9 +445,8 @@ def grafico_stipendi(df_dettaglio):
                label=f'Media mensile: €{media:,.0f}')
     
     # Etichette valori sopra le barre
-    for i, v in enumerate(df_mensile['importo']):
-        ax.annotate(f'€{v:,.0f}', xy=(i, v), xytext=(0, 8), 
-                    textcoords='offset points', ha='center', fontsize=9, fontweight='bold')
+    ax.bar_label(bars, labels=[f'€{v:,.0f}' for v in df_mensile['importo']],
+                 padding=8, fontsize=9, fontweight='bold')
     
     ax.set_xlabel('Mese', fontsize=12)
     ax.set_ylabel('Stipendio (€)', fontsize=12)
@@ -347,11 +456,12 @@ def grafico_stipendi(df_dettaglio):
     ax.legend(loc='upper right')
     
     # Box con statistiche
-    totale = df_mensile['importo'].sum()
-    max_val = df_mensile['importo'].max()
-    min_val = df_mensile['importo'].min()
-    mese_max = df_mensile.loc[df_mensile['importo'].idxmax(), 'data_label']
-    mese_min = df_mensile.loc[df_mensile['importo'].idxmin(), 'data_label']
+    importi = df_mensile['importo'].to_numpy()
+    i_max, i_min = importi.argmax(), importi.argmin()
+    totale = importi.sum()
+    max_val, min_val = importi[i_max], importi[i_min]
+    mese_max = df_mensile['data_label'].iloc[i_max]
+    mese_min = df_mensile['data_label'].iloc[i_min]
     
     stats_text = (f'Totale periodo: €{totale:,.0f}\n'
                   f'Massimo: €{max_val:,.0f} ({mese_max})\n'
@@ -360,32 +470,79 @@ def grafico_stipendi(df_dettaglio):
     ax.text(0.02, 0.98, stats_text, transform=ax.transAxes, fontsize=10,
             verticalalignment='top', bbox=dict(boxstyle='round', facecolor='lightgreen', alpha=0.5))
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
 
-def genera_grafici_per_categoria(df_dettaglio):
-    """Genera un grafico per ogni combinazione categoria/sottocategoria di spesa."""
+# Figura riutilizzata da tutti i grafici per categoria disegnati nello stesso processo
+_figura_categoria = None
+
+
+def _salva_grafico_categoria(df_mensile, categoria, sottocategoria, color_idx, filepath):
+    """
+    Disegna e salva il grafico di una categoria/sottocategoria.
+    Eseguita nei processi worker: riceve solo le spese mensili della categoria
+    e ridisegna sempre la stessa figura (svuotata con ax.clear) invece di crearne una nuova.
+    
+    Returns:
+        Il percorso del file salvato, oppure None se non ci sono dati
+    """
+    global _figura_categoria
+    
+    if df_mensile.empty:
+        return None
+    
+    if _figura_categoria is None:
+        _figura_categoria = plt.subplots(figsize=(12, 5))
+    fig, ax = _figura_categoria
+    ax.clear()
+    # Margini di partenza come in una figura nuova (tight_layout parte da questi)
+    fig.subplots_adjust(**{k: plt.rcParams[f'figure.subplot.{k}']
+                           for k in ('left', 'right', 'bottom', 'top')})
+    
+    _disegna_singola_categoria(ax, df_mensile, categoria, sottocategoria, color_idx)
+    fig.savefig(filepath, dpi=150, facecolor='white')
+    return filepath
+
+
+def genera_grafici_per_categoria(df_uscite, firme_precedenti, firme):
+    """
+    Genera e salva un grafico per ogni combinazione categoria/sottocategoria di spesa.
+    I grafici sono indipendenti tra loro e vengono disegnati in parallelo su più processi;
+    quelli già presenti con la stessa firma in firme_precedenti non vengono ridisegnati.
+    Le firme dei grafici generati o invariati vengono aggiunte a firme.
     
-    df_uscite = df_dettaglio[df_dettaglio['tipo'] == 'uscita'].copy()
-    df_uscite['importo'] = df_uscite['importo'].abs()
+    Returns:
+        Lista di tuple (percorso file, etichetta, errore o None, invariato) dei grafici
+    """
     
     # Verifica se esiste la colonna sottocategoria
     has_sottocategoria = 'sottocategoria' in df_uscite.columns
+    chiavi = ['categoria', 'sottocategoria'] if has_sottocategoria else ['categoria']
     
-    grafici_generati = []
+    # Spese mensili di tutte le categorie in un solo raggruppamento:
+    # a ogni grafico (e worker) viene passata solo la propria porzione
+    mensile = df_uscite.groupby(chiavi + ['data_dt', 'data_label'], observed=True)['importo'].sum()
+    
+    def spese_mensili(chiave):
+        return mensile.loc[chiave].reset_index(level='data_label').reset_index(drop=True)
+    
+    # Lavori da eseguire: (nome file, etichetta, argomenti per _salva_grafico_categoria)
+    lavori = []
     
     if has_sottocategoria:
         # Raggruppa per categoria + sottocategoria
-        grouped = df_uscite.groupby(['categoria', 'sottocategoria'])['importo'].sum()
+        grouped = df_uscite.groupby(['categoria', 'sottocategoria'], observed=True, sort=False)['importo'].sum()
         grouped = grouped.sort_values(ascending=False)
         
         for i, ((categoria, sottocategoria), totale) in enumerate(grouped.items()):
+            df_mensile = spese_mensili((categoria, sottocategoria))
+            
             # Genera nome file sicuro
-            cat_sicuro = categoria.replace(' ', '_').replace(',', '').replace('/', '_')
+            cat_sicuro = categoria.translate(_NOME_FILE_SICURO)
             
             if pd.notna(sottocategoria):
-                sotto_sicuro = sottocategoria.replace(' ', '_').replace(',', '').replace('/', '_')
+                sotto_sicuro = sottocategoria.translate(_NOME_FILE_SICURO)
                 filename = f"cat_{i+1:02d}_{cat_sicuro}_{sotto_sicuro}.png"
                 label = f"{categoria} > {sottocategoria}"
             else:
@@ -393,72 +550,102 @@ def genera_grafici_per_categoria(df_dettaglio):
                 label = categoria
                 sottocategoria = None
             
-            fig = grafico_singola_categoria_spesa(df_dettaglio, categoria, sottocategoria, i)
-            
-            if fig is not None:
-                grafici_generati.append((filename, fig, label))
+            lavori.append((filename, label, (df_mensile, categoria, sottocategoria, i)))
     else:
         # Fallback: solo per categoria (compatibilità con dati vecchi)
-        categorie = df_uscite.groupby('categoria')['importo'].sum().sort_values(ascending=False)
+        categorie = df_uscite.groupby('categoria', observed=True, sort=False)['importo'].sum().sort_values(ascending=False)
         
         for i, (categoria, totale) in enumerate(categorie.items()):
-            nome_sicuro = categoria.replace(' ', '_').replace(',', '').replace('/', '_')
+            nome_sicuro = categoria.translate(_NOME_FILE_SICURO)
             filename = f"cat_{i+1:02d}_{nome_sicuro}.png"
             
-            fig = grafico_singola_categoria_spesa(df_dettaglio, categoria, None, i)
-            
-            if fig is not None:
-                grafici_generati.append((filename, fig, categoria))
+            lavori.append((filename, categoria, (spese_mensili(categoria), categoria, None, i)))
+    
+    grafici_generati = []
+    
+    # Solo i grafici con dati cambiati vengono ridisegnati
+    da_disegnare = []
+    for filename, label, args in lavori:
+        if args[0].empty:
+            continue
+        firma = firma_grafico(filename, *args)
+        firme[filename] = firma
+        if grafico_invariato(filename, firma, firme_precedenti):
+            grafici_generati.append((os.path.join(OUTPUT_DIR, filename), label, None, True))
+        else:
+            da_disegnare.append((filename, label, args))
+    
+    if not da_disegnare:
+        return grafici_generati
+    
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(da_disegnare))) as executor:
+        futures = [
+            executor.submit(_salva_grafico_categoria, *args, os.path.join(OUTPUT_DIR, filename))
+            for filename, _, args in da_disegnare
+        ]
+        
+        for (filename, label, _), future in zip(da_disegnare, futures):
+            try:
+                filepath = future.result()
+            except Exception as e:
+                del firme[filename]
+                grafici_generati.append((os.path.join(OUTPUT_DIR, filename), label, e, False))
+                continue
+            if filepath is not None:
+                grafici_generati.append((filepath, label, None, False))
     
     return grafici_generati
 
 
-def genera_report_statistiche(df_riepilogo, df_dettaglio):
+def genera_report_statistiche(df_riepilogo, totali_categorie):
     """Genera un file di testo con statistiche chiave."""
     
     report_path = os.path.join(OUTPUT_DIR, "statistiche_report.txt")
     
+    # Il report viene composto in memoria e scritto con una sola write
+    parts = []
+    parts.append("=" * 70 + "\n")
+    parts.append("REPORT STATISTICHE FLUSSI DI CASSA\n")
+    parts.append(f"Generato il: {datetime.now().strftime('%d/%m/%Y %H:%M')}\n")
+    parts.append("=" * 70 + "\n\n")
+    
+    parts.append(f"📅 Periodo: {df_riepilogo['data_label'].iloc[0]} - {df_riepilogo['data_label'].iloc[-1]}\n")
+    parts.append(f"📊 Mesi analizzati: {len(df_riepilogo)}\n\n")
+    
+    parts.append("─" * 50 + "\n")
+    parts.append("RIEPILOGO GENERALE\n")
+    parts.append("─" * 50 + "\n")
+    parts.append(f"Entrate totali:     €{df_riepilogo['totale_entrate'].sum():>15,.2f}\n")
+    parts.append(f"Uscite totali:      €{df_riepilogo['totale_uscite'].sum():>15,.2f}\n")
+    parts.append(f"Saldo totale:       €{df_riepilogo['saldo'].sum():>15,.2f}\n\n")
+    
+    parts.append("─" * 50 + "\n")
+    parts.append("MEDIE MENSILI\n")
+    parts.append("─" * 50 + "\n")
+    parts.append(f"Entrate medie:      €{df_riepilogo['totale_entrate'].mean():>15,.2f}\n")
+    parts.append(f"Uscite medie:       €{df_riepilogo['totale_uscite'].mean():>15,.2f}\n")
+    parts.append(f"Saldo medio:        €{df_riepilogo['saldo'].mean():>15,.2f}\n\n")
+    
+    saldi = df_riepilogo['saldo'].to_numpy()
+    mese_migliore = df_riepilogo.iloc[saldi.argmax()]
+    mese_peggiore = df_riepilogo.iloc[saldi.argmin()]
+    
+    parts.append("─" * 50 + "\n")
+    parts.append("ESTREMI\n")
+    parts.append("─" * 50 + "\n")
+    parts.append(f"Mese migliore: {mese_migliore['data_label']} (€{mese_migliore['saldo']:,.2f})\n")
+    parts.append(f"Mese peggiore: {mese_peggiore['data_label']} (€{mese_peggiore['saldo']:,.2f})\n\n")
+    
+    # Top categorie (importi con segno: le uscite sono negative)
+    top_uscite = totali_categorie['importo_netto'].nsmallest(10)
+    
+    parts.append("─" * 50 + "\n")
+    parts.append("TOP 10 CATEGORIE DI SPESA\n")
+    parts.append("─" * 50 + "\n")
+    parts.extend(f"{cat:35} €{val:>12,.2f}\n" for cat, val in top_uscite.items())
+    
     with open(report_path, 'w', encoding='utf-8') as f:
-        f.write("=" * 70 + "\n")
-        f.write("REPORT STATISTICHE FLUSSI DI CASSA\n")
-        f.write(f"Generato il: {datetime.now().strftime('%d/%m/%Y %H:%M')}\n")
-        f.write("=" * 70 + "\n\n")
-        
-        f.write(f"📅 Periodo: {df_riepilogo['data_label'].iloc[0]} - {df_riepilogo['data_label'].iloc[-1]}\n")
-        f.write(f"📊 Mesi analizzati: {len(df_riepilogo)}\n\n")
-        
-        f.write("─" * 50 + "\n")
-        f.write("RIEPILOGO GENERALE\n")
-        f.write("─" * 50 + "\n")
-        f.write(f"Entrate totali:     €{df_riepilogo['totale_entrate'].sum():>15,.2f}\n")
-        f.write(f"Uscite totali:      €{df_riepilogo['totale_uscite'].sum():>15,.2f}\n")
-        f.write(f"Saldo totale:       €{df_riepilogo['saldo'].sum():>15,.2f}\n\n")
-        
-        f.write("─" * 50 + "\n")
-        f.write("MEDIE MENSILI\n")
-        f.write("─" * 50 + "\n")
-        f.write(f"Entrate medie:      €{df_riepilogo['totale_entrate'].mean():>15,.2f}\n")
-        f.write(f"Uscite medie:       €{df_riepilogo['totale_uscite'].mean():>15,.2f}\n")
-        f.write(f"Saldo medio:        €{df_riepilogo['saldo'].mean():>15,.2f}\n\n")
-        
-        mese_migliore = df_riepilogo.loc[df_riepilogo['saldo'].idxmax()]
-        mese_peggiore = df_riepilogo.loc[df_riepilogo['saldo'].idxmin()]
-        
-        f.write("─" * 50 + "\n")
-        f.write("ESTREMI\n")
-        f.write("─" * 50 + "\n")
-        f.write(f"Mese migliore: {mese_migliore['data_label']} (€{mese_migliore['saldo']:,.2f})\n")
-        f.write(f"Mese peggiore: {mese_peggiore['data_label']} (€{mese_peggiore['saldo']:,.2f})\n\n")
-        
-        # Top categorie
-        df_uscite = df_dettaglio[df_dettaglio['tipo'] == 'uscita']
-        top_uscite = df_uscite.groupby('categoria')['importo'].sum().sort_values().head(10)
-        
-        f.write("─" * 50 + "\n")
-        f.write("TOP 10 CATEGORIE DI SPESA\n")
-        f.write("─" * 50 + "\n")
-        for cat, val in top_uscite.items():
-            f.write(f"{cat:35} €{val:>12,.2f}\n")
+        f.write(''.join(parts))
     
     print(f"   💾 Report statistiche: {report_path}")
 
@@ -474,52 +661,83 @@ def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     print(f"\n📁 Cartella output: {OUTPUT_DIR}")
     
-    # Elimina grafici esistenti prima di creare i nuovi
-    elimina_grafici_vecchi()
+    # Di norma i grafici esistenti vengono ridisegnati solo se i loro dati sono
+    # cambiati; con RIGENERA_GRAFICI vengono eliminati e ridisegnati tutti
+    if RIGENERA_GRAFICI:
+        elimina_grafici_vecchi()
+    firme_precedenti = carica_firme()
+    firme = {}
     
     # Carica dati
-    df_riepilogo, df_dettaglio = carica_dati()
+    df_riepilogo, df_dettaglio, df_uscite = carica_dati()
+    
+    # Totali per categoria delle uscite (in valore assoluto e con segno),
+    # calcolati una volta e condivisi da grafici e report
+    totali_categorie = df_uscite.groupby('categoria', observed=True)[['importo', 'importo_netto']].sum()
     
     # Grafici principali
     grafici_principali = [
         ("01_andamento_mensile.png", grafico_andamento_mensile, [df_riepilogo]),
-        ("02_categorie_spesa.png", grafico_categorie_spesa, [df_dettaglio]),
-        ("03_trend_categorie.png", grafico_trend_categorie, [df_dettaglio]),
+        ("02_categorie_spesa.png", grafico_categorie_spesa, [totali_categorie]),
+        ("03_trend_categorie.png", grafico_trend_categorie, [df_riepilogo, df_uscite, totali_categorie]),
         ("04_stipendi.png", grafico_stipendi, [df_dettaglio]),
     ]
     
     print("\n📊 Generazione grafici principali...")
     
+    # Prima vengono costruite tutte le figure, nel thread principale; solo dopo il
+    # salvataggio (rendering Agg e compressione PNG) gira in parallelo nei thread.
+    # Le figure sono create con Figure e non con pyplot: nessuno stato globale condiviso
+    da_salvare = []
     for filename, func, args in grafici_principali:
         print(f"\n   🔄 {filename}...")
+        filepath = os.path.join(OUTPUT_DIR, filename)
+        firma = firma_grafico(filename, *args)
+        if grafico_invariato(filename, firma, firme_precedenti):
+            firme[filename] = firma
+            print(f"   ⏭️  Invariato: {filepath}")
+            continue
         try:
             fig = func(*args)
             if fig is not None:
-                filepath = os.path.join(OUTPUT_DIR, filename)
-                fig.savefig(filepath, dpi=150, bbox_inches='tight', facecolor='white')
-                plt.close(fig)
-                print(f"   ✅ Salvato: {filepath}")
+                da_salvare.append((filename, filepath, firma, fig))
         except Exception as e:
             print(f"   ❌ Errore: {e}")
     
+    with ThreadPoolExecutor(max_workers=max(1, len(da_salvare))) as executor:
+        futures = [executor.submit(fig.savefig, filepath, dpi=150, facecolor='white')
+                   for _, filepath, _, fig in da_salvare]
+    
+    for (filename, filepath, firma, _), future in zip(da_salvare, futures):
+        try:
+            future.result()
+            firme[filename] = firma
+            print(f"   ✅ Salvato: {filepath}")
+        except Exception as e:
+            print(f"   ❌ Errore salvando {filename}: {e}")
+    
     # Grafici per singola categoria
     print("\n📊 Generazione grafici per categoria di spesa...")
     
-    grafici_categorie = genera_grafici_per_categoria(df_dettaglio)
+    grafici_categorie = genera_grafici_per_categoria(df_uscite, firme_precedenti, firme)
     
-    for filename, fig, categoria in grafici_categorie:
+    for filepath, categoria, errore, invariato in grafici_categorie:
         print(f"   🔄 {categoria}...")
-        try:
-            filepath = os.path.join(OUTPUT_DIR, filename)
-            fig.savefig(filepath, dpi=150, bbox_inches='tight', facecolor='white')
-            plt.close(fig)
+        if errore is not None:
+            print(f"   ❌ Errore: {errore}")
+        elif invariato:
+            print(f"   ⏭️  Invariato: {filepath}")
+        else:
             print(f"   ✅ Salvato: {filepath}")
-        except Exception as e:
-            print(f"   ❌ Errore: {e}")
+    
+    # Elimina i grafici non più generati e salva le firme per la prossima esecuzione
+    elimina_grafici_obsoleti(firme)
+    with open(FILE_FIRME, 'w', encoding='utf-8') as f:
+        json.dump(firme, f, indent=2)
     
     # Genera report statistiche
     print("\n📝 Generazione report...")
-    genera_report_statistiche(df_riepilogo, df_dettaglio)
+    genera_report_statistiche(df_riepilogo, totali_categorie)
     
     print("\n" + "=" * 70)
     print("✅ GENERAZIONE COMPLETATA")
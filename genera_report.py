@@ -5,11 +5,23 @@ Legge le categorie da Categorie_per_grafici.csv
 Uso: python genera_report.py
 """
 
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # Solo salvataggio su file: nessun backend interattivo
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import os
+import glob
 import html
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # Opzionale: senza pyarrow CSV e somme vengono gestiti da pandas
+    pa = None
 
 # Directory dello script (per path relativi)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21,8 +33,21 @@ OUTPUT_DIR = os.path.join(SCRIPT_DIR, "grafici")
 REPORT_FILE = os.path.join(SCRIPT_DIR, "Report_Flussi_Cassa.md")
 REPORT_HTML_FILE = os.path.splitext(REPORT_FILE)[0] + ".html"
 
+# Colonne lette dal CSV dettaglio e relativi tipi (le colonne non usate non vengono caricate).
+# Le chiavi dei raggruppamenti sono category (groupby sui codici interi);
+# gli importi restano float64: il report li stampa al centesimo.
+DTYPE_DETTAGLIO = {
+    'data': 'str', 'data_label': 'category',
+    'tipo': 'category', 'categoria': 'category', 'sottocategoria': 'category',
+    'importo': 'float64',
+}
+
 # Stile grafici
 plt.style.use('seaborn-v0_8-whitegrid')
+plt.rcParams.update({
+    'agg.path.chunksize': 10000,
+    'figure.max_open_warning': 0,
+})
 
 # Colori distinti per le sottocategorie
 CATEGORY_COLORS = [
@@ -32,12 +57,29 @@ CATEGORY_COLORS = [
 ]
 
 
+def elimina_grafici_aggregati_vecchi():
+    """Elimina i grafici aggregati (agg_*.png) esistenti prima di generare i nuovi."""
+    files_png = glob.glob(os.path.join(OUTPUT_DIR, "agg_*.png"))
+    for f in files_png:
+        try:
+            os.remove(f)
+        except Exception as e:
+            print(f"   ⚠️ Errore eliminando {f}: {e}")
+
+
 def carica_dati():
-    """Carica i dati dal CSV dettaglio."""
+    """Carica i dati dal CSV dettaglio (importi in valore assoluto)."""
     print("📂 Caricamento dati...")
     
-    df = pd.read_csv(CSV_DETTAGLIO)
-    df['data_dt'] = pd.to_datetime(df['data'] + '-01')
+    # Tipi espliciti, niente inferenza; con pyarrow la lettura è multithread
+    if pa is not None:
+        opzioni = {'engine': 'pyarrow'}
+    else:
+        opzioni = {'engine': 'c', 'float_precision': 'round_trip'}
+    df = pd.read_csv(CSV_DETTAGLIO, dtype=DTYPE_DETTAGLIO, usecols=list(DTYPE_DETTAGLIO), **opzioni)
+    # I grafici usano solo importi in valore assoluto: abs una sola volta su tutta la colonna
+    df['importo'] = df['importo'].abs()
+    df['data_dt'] = pd.to_datetime(df['data'], format='%Y-%m', cache=True)
     df = df.sort_values('data_dt')
     
     print(f"   ✅ Dettaglio: {len(df)} record")
@@ -51,54 +93,41 @@ def carica_categorie_config():
     df_config = pd.read_csv(CSV_CATEGORIE)
     
     # Normalizza i nomi (sostituisci _ con spazi)
-    df_config['Categoria'] = df_config['Categoria'].str.replace('_', ' ')
-    df_config['Sottocategoria'] = df_config['Sottocategoria'].str.replace('_', ' ')
+    df_config['Categoria'] = df_config['Categoria'].str.replace('_', ' ', regex=False)
+    df_config['Sottocategoria'] = df_config['Sottocategoria'].str.replace('_', ' ', regex=False)
     
     print(f"   ✅ Categorie configurate: {len(df_config)}")
     return df_config
 
 
-def grafico_categoria_aggregata(df_dettaglio, categoria, sottocategorie_filtro):
+def grafico_categoria_aggregata(spese_cat, categoria, sottocategorie_filtro, mesi_ordinati, ax=None):
     """
     Genera un grafico a barre che mostra l'andamento mensile 
     di una categoria con le sottocategorie impilate.
     
     Args:
-        df_dettaglio: DataFrame con i dati
+        spese_cat: Spese della categoria (in valore assoluto) sommate per
+                   mese e sottocategoria (indice data_label, sottocategoria)
         categoria: Nome della categoria
         sottocategorie_filtro: Lista di sottocategorie o ['*'] per tutte
+        mesi_ordinati: Etichette di tutti i mesi in ordine di data
+        ax: Assi (già svuotati) su cui disegnare; se None viene creata una nuova figura
     """
     
-    # Filtra per categoria e tipo uscita
-    df_cat = df_dettaglio[(df_dettaglio['categoria'] == categoria) & 
-                          (df_dettaglio['tipo'] == 'uscita')].copy()
-    
-    if df_cat.empty:
+    if spese_cat.empty:
         return None, None
     
     # Se '*', prendi tutte le sottocategorie
-    if '*' in sottocategorie_filtro:
-        sottocategorie = df_cat['sottocategoria'].dropna().unique().tolist()
-    else:
-        sottocategorie = sottocategorie_filtro
-        df_cat = df_cat[df_cat['sottocategoria'].isin(sottocategorie)]
+    if '*' not in sottocategorie_filtro:
+        spese_cat = spese_cat[spese_cat.index.get_level_values('sottocategoria').isin(sottocategorie_filtro)]
     
-    if df_cat.empty:
+    if spese_cat.empty:
         return None, None
     
-    df_cat['importo'] = df_cat['importo'].abs()
-    
-    # Pivot per avere mesi come righe e sottocategorie come colonne
-    df_pivot = df_cat.pivot_table(
-        index='data_label',
-        columns='sottocategoria',
-        values='importo',
-        aggfunc='sum',
-        fill_value=0
-    )
+    # Mesi come righe e sottocategorie come colonne
+    df_pivot = spese_cat.unstack('sottocategoria', fill_value=0)
     
     # Ordina per data
-    mesi_ordinati = df_dettaglio.sort_values('data_dt')['data_label'].unique()
     df_pivot = df_pivot.reindex([m for m in mesi_ordinati if m in df_pivot.index])
     
     # Ordina le colonne per totale (sottocategorie più costose prima)
@@ -106,22 +135,29 @@ def grafico_categoria_aggregata(df_dettaglio, categoria, sottocategorie_filtro):
     df_pivot = df_pivot[col_order]
     
     # Crea il grafico a barre impilate
-    fig, ax = plt.subplots(figsize=(14, 7))
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(14, 7))
+    else:
+        fig = ax.figure
     
-    x = range(len(df_pivot))
+    x = np.arange(len(df_pivot))
     width = 0.7
-    bottom = [0] * len(df_pivot)
     
-    bars_list = []
+    # Base di ogni segmento: somma cumulata delle sottocategorie precedenti (mesi x sottocategorie)
+    vals = df_pivot.to_numpy(dtype='float64')
+    cumulate = vals.cumsum(axis=1)
+    bottoms = np.hstack([np.zeros((len(vals), 1)), cumulate[:, :-1]])
+    
     for i, sotto in enumerate(df_pivot.columns):
         color = CATEGORY_COLORS[i % len(CATEGORY_COLORS)]
-        bars = ax.bar(x, df_pivot[sotto], width, bottom=bottom, 
-                      label=sotto, color=color, alpha=0.85)
-        bars_list.append(bars)
-        bottom = [b + v for b, v in zip(bottom, df_pivot[sotto])]
+        ax.bar(x, vals[:, i], width, bottom=bottoms[:, i],
+               label=sotto, color=color, alpha=0.85)
+    
+    # Totale di ogni mese (ultima colonna della somma cumulata)
+    totali_mese = cumulate[:, -1]
     
     # Aggiungi totale sopra ogni barra
-    for i, total in enumerate(bottom):
+    for i, total in enumerate(totali_mese):
         ax.annotate(f'€{total:,.0f}', xy=(i, total), xytext=(0, 5),
                     textcoords='offset points', ha='center', fontsize=9, fontweight='bold')
     
@@ -142,14 +178,15 @@ def grafico_categoria_aggregata(df_dettaglio, categoria, sottocategorie_filtro):
     ax.legend(loc='upper left', bbox_to_anchor=(1.02, 1), title='Sottocategorie')
     
     # Box statistiche
-    totale_periodo = df_pivot.sum().sum()
-    media_mensile = df_pivot.sum(axis=1).mean()
+    i_max = int(totali_mese.argmax())
+    totale_periodo = float(totali_mese.sum())
+    media_mensile = float(totali_mese.mean())
     
     stats_text = f'Totale periodo: €{totale_periodo:,.0f}\nMedia mensile: €{media_mensile:,.0f}'
     ax.text(0.02, 0.98, stats_text, transform=ax.transAxes, fontsize=10,
             verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
     
-    plt.tight_layout()
+    fig.tight_layout()
     
     # Informazioni per il report
     info = {
@@ -157,50 +194,143 @@ def grafico_categoria_aggregata(df_dettaglio, categoria, sottocategorie_filtro):
         'sottocategorie': list(df_pivot.columns),
         'totale': totale_periodo,
         'media_mensile': media_mensile,
-        'mese_max': df_pivot.sum(axis=1).idxmax(),
-        'max_val': df_pivot.sum(axis=1).max(),
+        'mese_max': df_pivot.index[i_max],
+        'max_val': float(totali_mese[i_max]),
     }
+    # Ancora e testi escapati per HTML, calcolati una volta e usati da indice e sezioni
+    info['anchor'] = categoria.lower().replace(' ', '-').replace(',', '')
+    info['categoria_esc'] = html.escape(categoria)
+    info['mese_max_esc'] = html.escape(info['mese_max'])
     
     return fig, info
 
 
+# Figura riutilizzata da tutti i grafici aggregati disegnati nello stesso processo
+_figura_aggregata = None
+
+
+def _salva_grafico_aggregato(spese_cat, categoria, sottocategorie, mesi_ordinati, filepath):
+    """
+    Disegna e salva il grafico aggregato di una categoria.
+    Eseguita nei processi worker: riceve solo le spese mensili della categoria
+    e ridisegna sempre la stessa figura (svuotata con ax.clear) invece di crearne una nuova.
+    
+    Returns:
+        Le informazioni per il report, oppure None se non ci sono dati
+    """
+    global _figura_aggregata
+    
+    if _figura_aggregata is None:
+        _figura_aggregata = plt.subplots(figsize=(14, 7))
+    fig, ax = _figura_aggregata
+    ax.clear()
+    # Margini di partenza come in una figura nuova (tight_layout parte da questi)
+    fig.subplots_adjust(**{k: plt.rcParams[f'figure.subplot.{k}']
+                           for k in ('left', 'right', 'bottom', 'top')})
+    
+    fig, info = grafico_categoria_aggregata(spese_cat, categoria, sottocategorie, mesi_ordinati, ax)
+    if fig is None:
+        return None
+    
+    # Senza bbox_inches='tight' (un secondo passaggio di layout a ogni salvataggio):
+    # tight_layout fa già rientrare legenda ed etichette nella figura
+    fig.savefig(filepath, dpi=150, facecolor='white')
+    return info
+
+
+def somma_spese(df_uscite):
+    """
+    Somma le spese per categoria, mese e sottocategoria.
+    Con pyarrow l'aggregazione gira su colonne Arrow (dizionari per le chiavi),
+    altrimenti con il groupby di pandas; le righe con chiavi mancanti sono escluse.
+    
+    Returns:
+        Serie degli importi con indice (categoria, data_label, sottocategoria)
+    """
+    chiavi = ['categoria', 'data_label', 'sottocategoria']
+    
+    if pa is None:
+        return df_uscite.groupby(chiavi, observed=True, sort=False)['importo'].sum()
+    
+    tabella = pa.Table.from_pandas(df_uscite[chiavi + ['importo']], preserve_index=False)
+    valide = pc.and_(pc.and_(pc.is_valid(tabella['categoria']), pc.is_valid(tabella['data_label'])),
+                     pc.is_valid(tabella['sottocategoria']))
+    somme = tabella.filter(valide).group_by(chiavi, use_threads=False).aggregate([('importo', 'sum')])
+    return somme.to_pandas().set_index(chiavi)['importo_sum'].rename('importo')
+
+
 def genera_grafici_aggregati(df_dettaglio, df_config):
-    """Genera i grafici aggregati secondo la configurazione."""
+    """
+    Genera i grafici aggregati secondo la configurazione.
+    Le categorie sono indipendenti tra loro e vengono disegnate in parallelo su più processi.
+    """
     
     print("\n📊 Generazione grafici aggregati...")
     
     grafici_info = []
     
-    # Raggruppa per categoria
-    categorie_config = df_config.groupby('Categoria')['Sottocategoria'].apply(list).to_dict()
-    
+    # Raggruppa per categoria (in ordine alfabetico, come numerazione dei file agg_NN)
+    categorie_config = {}
+    for categoria, sottocategoria in zip(df_config['Categoria'].to_numpy(),
+                                         df_config['Sottocategoria'].to_numpy()):
+        if pd.notna(categoria):
+            categorie_config.setdefault(categoria, []).append(sottocategoria)
+    categorie_config = dict(sorted(categorie_config.items()))
+    if not categorie_config:
+        return grafici_info
+    
+    # Spese di tutte le categorie sommate per mese e sottocategoria in un solo
+    # raggruppamento, poi divise per categoria: a ogni grafico (e worker)
+    # viene passata solo la propria porzione
+    df_uscite = df_dettaglio[df_dettaglio['tipo'].to_numpy() == 'uscita']
+    spese = somma_spese(df_uscite)
+    spese_per_categoria = {categoria: spese_cat.droplevel('categoria')
+                           for categoria, spese_cat in spese.groupby(level='categoria', observed=True, sort=False)}
+    
+    # Etichette dei mesi in ordine di data, comuni a tutti i grafici
+    mesi_ordinati = (df_dettaglio.drop_duplicates('data_label')
+                     .sort_values('data_dt')['data_label'].to_numpy())
+    
+    # Nome file con l'indice della categoria nella configurazione;
+    # le categorie senza spese non diventano lavori (args None)
+    lavori = []
     for i, (categoria, sottocategorie) in enumerate(categorie_config.items()):
-        print(f"\n   🔄 {categoria}...")
+        nome_sicuro = categoria.replace(' ', '_').replace(',', '').replace('/', '_')
+        filename = f"agg_{i+1:02d}_{nome_sicuro}.png"
+        filepath = os.path.join(OUTPUT_DIR, filename)
+        spese_cat = spese_per_categoria.get(categoria)
+        args = None if spese_cat is None else (spese_cat, categoria, sottocategorie, mesi_ordinati, filepath)
+        lavori.append((filename, filepath, categoria, args))
+    
+    n_lavori = sum(args is not None for _, _, _, args in lavori)
+    with ProcessPoolExecutor(max_workers=max(1, min(os.cpu_count() or 1, n_lavori))) as executor:
+        futures = [
+            executor.submit(_salva_grafico_aggregato, *args) if args is not None else None
+            for _, _, _, args in lavori
+        ]
         
-        fig, info = grafico_categoria_aggregata(df_dettaglio, categoria, sottocategorie)
-        
-        if fig is not None:
-            # Nome file
-            nome_sicuro = categoria.replace(' ', '_').replace(',', '').replace('/', '_')
-            filename = f"agg_{i+1:02d}_{nome_sicuro}.png"
-            filepath = os.path.join(OUTPUT_DIR, filename)
-            
-            fig.savefig(filepath, dpi=150, bbox_inches='tight', facecolor='white')
-            plt.close(fig)
+        # Risultati nell'ordine della configurazione
+        for (filename, filepath, categoria, _), future in zip(lavori, futures):
+            print(f"\n   🔄 {categoria}...")
+            try:
+                info = future.result() if future is not None else None
+            except Exception as e:
+                print(f"   ❌ Errore: {e}")
+                continue
             
-            info['filename'] = filename
-            grafici_info.append(info)
-            
-            print(f"   ✅ Salvato: {filepath}")
-        else:
-            print(f"   ⚠️  Nessun dato per {categoria}")
+            if info is not None:
+                info['filename'] = filename
+                grafici_info.append(info)
+                
+                print(f"   ✅ Salvato: {filepath}")
+            else:
+                print(f"   ⚠️  Nessun dato per {categoria}")
     
     return grafici_info
 
 
-def _get_html_css() -> str:
-    """Restituisce il CSS per il report HTML."""
-    return """
+# CSS del report HTML
+_HTML_CSS = """
 :root { --text:#24292f; --muted:#57606a; --border:#d0d7de; --bg:#ffffff; --bg-subtle:#f6f8fa; }
 body { background: var(--bg); margin: 0; }
 .report-body { box-sizing: border-box; min-width: 200px; max-width: 900px; margin: 24px auto; padding: 0 20px; color: var(--text); font-family: -apple-system, Segoe UI, Roboto, Helvetica, Arial, sans-serif; line-height: 1.6; }
@@ -222,102 +352,111 @@ body { background: var(--bg); margin: 0; }
 """
 
 
-def genera_report_html_nativo(grafici_info, df_config) -> str:
-    """Genera il report HTML con tag nativi (senza conversione da Markdown)."""
+def genera_report_html_nativo(f_html, grafici_info, df_config) -> None:
+    """
+    Scrive il report HTML con tag nativi (senza conversione da Markdown)
+    sul file (o buffer di testo) f_html, una riga alla volta.
+    """
 
-    html_parts = []
+    f_html.write(f"""<!doctype html>
+<html lang="it">
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>Report Flussi di Cassa</title>
+    <style>{_HTML_CSS}</style>
+</head>
+<body>
+    <article class="report-body">
+        """)
+
+    # Righe del body indentate come nell'articolo (nessuna indentazione prima della prima)
+    separatore = ''
+
+    def scrivi(riga):
+        nonlocal separatore
+        f_html.write(separatore)
+        f_html.write(riga)
+        separatore = '\n        '
 
     # Intestazione
-    html_parts.append(f'<h1>📊 Report Flussi di Cassa</h1>')
-    html_parts.append(f'<p class="date">Generato il: {datetime.now().strftime("%d/%m/%Y %H:%M")}</p>')
-    html_parts.append('<hr>')
+    scrivi(f'<h1>📊 Report Flussi di Cassa</h1>')
+    scrivi(f'<p class="date">Generato il: {datetime.now().strftime("%d/%m/%Y %H:%M")}</p>')
+    scrivi('<hr>')
 
     # Indice
-    html_parts.append('<h2>📑 Indice</h2>')
-    html_parts.append('<ol class="toc">')
-    html_parts.append('<li><a href="#panoramica-generale">Panoramica generale</a></li>')
+    scrivi('<h2>📑 Indice</h2>')
+    scrivi('<ol class="toc">')
+    scrivi('<li><a href="#panoramica-generale">Panoramica generale</a></li>')
     for info in grafici_info:
-        anchor = info['categoria'].lower().replace(' ', '-').replace(',', '')
-        html_parts.append(f'<li><a href="#{anchor}">{html.escape(info["categoria"])}</a></li>')
-    html_parts.append('</ol>')
-    html_parts.append('<hr>')
+        scrivi(f'<li><a href="#{info["anchor"]}">{info["categoria_esc"]}</a></li>')
+    scrivi('</ol>')
+    scrivi('<hr>')
 
     # Sezione panoramica con grafici generali
-    html_parts.append('<h2 id="panoramica-generale">Panoramica generale</h2>')
-    html_parts.append('<h3>📈 Andamento mensile</h3>')
-    html_parts.append('<p><img src="grafici/01_andamento_mensile.png" alt="Andamento mensile"></p>')
-    html_parts.append('<h3>💰 Categorie di spesa</h3>')
-    html_parts.append('<p><img src="grafici/02_categorie_spesa.png" alt="Categorie spesa"></p>')
-    html_parts.append('<hr>')
+    scrivi('<h2 id="panoramica-generale">Panoramica generale</h2>')
+    scrivi('<h3>📈 Andamento mensile</h3>')
+    scrivi('<p><img src="grafici/01_andamento_mensile.png" alt="Andamento mensile"></p>')
+    scrivi('<h3>💰 Categorie di spesa</h3>')
+    scrivi('<p><img src="grafici/02_categorie_spesa.png" alt="Categorie spesa"></p>')
+    scrivi('<hr>')
 
     # Sezioni per ogni categoria
     for info in grafici_info:
-        categoria = info['categoria']
-        anchor = categoria.lower().replace(' ', '-').replace(',', '')
-        
-        html_parts.append(f'<h2 id="{anchor}">{html.escape(categoria)}</h2>')
+        scrivi(f'<h2 id="{info["anchor"]}">{info["categoria_esc"]}</h2>')
 
         # Statistiche
-        html_parts.append('<h3>📈 Statistiche</h3>')
-        html_parts.append('<table>')
-        html_parts.append('<thead><tr><th>Metrica</th><th>Valore</th></tr></thead>')
-        html_parts.append('<tbody>')
-        html_parts.append(f'<tr><td><strong>Totale periodo</strong></td><td>€{info["totale"]:,.2f}</td></tr>')
-        html_parts.append(f'<tr><td><strong>Media mensile</strong></td><td>€{info["media_mensile"]:,.2f}</td></tr>')
-        html_parts.append(f'<tr><td><strong>Mese con spesa max</strong></td><td>{html.escape(info["mese_max"])} (€{info["max_val"]:,.2f})</td></tr>')
-        html_parts.append(f'<tr><td><strong>Sottocategorie</strong></td><td>{len(info["sottocategorie"])}</td></tr>')
-        html_parts.append('</tbody>')
-        html_parts.append('</table>')
+        scrivi('<h3>📈 Statistiche</h3>')
+        scrivi('<table>')
+        scrivi('<thead><tr><th>Metrica</th><th>Valore</th></tr></thead>')
+        scrivi('<tbody>')
+        scrivi(f'<tr><td><strong>Totale periodo</strong></td><td>€{info["totale"]:,.2f}</td></tr>')
+        scrivi(f'<tr><td><strong>Media mensile</strong></td><td>€{info["media_mensile"]:,.2f}</td></tr>')
+        scrivi(f'<tr><td><strong>Mese con spesa max</strong></td><td>{info["mese_max_esc"]} (€{info["max_val"]:,.2f})</td></tr>')
+        scrivi(f'<tr><td><strong>Sottocategorie</strong></td><td>{len(info["sottocategorie"])}</td></tr>')
+        scrivi('</tbody>')
+        scrivi('</table>')
 
         # Lista sottocategorie
-        html_parts.append('<h3>📋 Sottocategorie incluse</h3>')
-        html_parts.append('<ul>')
+        scrivi('<h3>📋 Sottocategorie incluse</h3>')
+        scrivi('<ul>')
         for sotto in info['sottocategorie']:
-            html_parts.append(f'<li>{html.escape(sotto)}</li>')
-        html_parts.append('</ul>')
+            scrivi(f'<li>{html.escape(sotto)}</li>')
+        scrivi('</ul>')
 
         # Grafico
-        html_parts.append('<h3>📊 Grafico</h3>')
-        html_parts.append(f'<p><img src="grafici/{info["filename"]}" alt="{html.escape(categoria)}"></p>')
-        html_parts.append('<hr>')
+        scrivi('<h3>📊 Grafico</h3>')
+        scrivi(f'<p><img src="grafici/{info["filename"]}" alt="{info["categoria_esc"]}"></p>')
+        scrivi('<hr>')
 
     # Footer
-    html_parts.append('<h2>📁 File di riferimento</h2>')
-    html_parts.append('<ul>')
-    html_parts.append('<li><strong>Dati dettaglio</strong>: <code>flussi_cassa_dettaglio.csv</code></li>')
-    html_parts.append('<li><strong>Riepilogo mensile</strong>: <code>flussi_cassa_riepilogo.csv</code></li>')
-    html_parts.append('<li><strong>Configurazione grafici</strong>: <code>Categorie_per_grafici.csv</code></li>')
-    html_parts.append('<li><strong>Grafici</strong>: cartella <code>grafici/</code></li>')
-    html_parts.append('</ul>')
-
-    body = '\n        '.join(html_parts)
-    css = _get_html_css()
-
-    return f"""<!doctype html>
-<html lang="it">
-<head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <title>Report Flussi di Cassa</title>
-    <style>{css}</style>
-</head>
-<body>
-    <article class="report-body">
-        {body}
+    scrivi('<h2>📁 File di riferimento</h2>')
+    scrivi('<ul>')
+    scrivi('<li><strong>Dati dettaglio</strong>: <code>flussi_cassa_dettaglio.csv</code></li>')
+    scrivi('<li><strong>Riepilogo mensile</strong>: <code>flussi_cassa_riepilogo.csv</code></li>')
+    scrivi('<li><strong>Configurazione grafici</strong>: <code>Categorie_per_grafici.csv</code></li>')
+    scrivi('<li><strong>Grafici</strong>: cartella <code>grafici/</code></li>')
+    scrivi('</ul>')
+
+    f_html.write("""
     </article>
 </body>
-</html>"""
+</html>""")
 
 
 def _scrivi_report_files(md_content: str, grafici_info: list, df_config) -> None:
-    """Scrive sia il report Markdown che la versione HTML nativa."""
+    """
+    Scrive sia il report Markdown che la versione HTML nativa.
+    Ogni file viene codificato in UTF-8 una volta e scritto con una sola write.
+    """
 
-    with open(REPORT_FILE, 'w', encoding='utf-8') as f_md:
-        f_md.write(md_content)
+    with open(REPORT_FILE, 'wb') as f_md:
+        f_md.write(md_content.encode('utf-8'))
 
-    html_content = genera_report_html_nativo(grafici_info, df_config)
-    with open(REPORT_HTML_FILE, 'w', encoding='utf-8') as f_html:
-        f_html.write(html_content)
+    buffer_html = io.StringIO()
+    genera_report_html_nativo(buffer_html, grafici_info, df_config)
+    with open(REPORT_HTML_FILE, 'wb') as f_html:
+        f_html.write(buffer_html.getvalue().encode('utf-8'))
 
 
 def genera_report_markdown(grafici_info, df_config):
@@ -336,8 +475,7 @@ def genera_report_markdown(grafici_info, df_config):
     lines.append("## 📑 Indice\n\n")
     lines.append("1. [Panoramica generale](#panoramica-generale)\n")
     for i, info in enumerate(grafici_info, 2):
-        anchor = info['categoria'].lower().replace(' ', '-').replace(',', '')
-        lines.append(f"{i}. [{info['categoria']}](#{anchor})\n")
+        lines.append(f"{i}. [{info['categoria']}](#{info['anchor']})\n")
     lines.append("\n---\n\n")
 
     # Sezione panoramica con grafici generali
@@ -408,6 +546,7 @@ def main():
 
     # Crea la cartella grafici se manca (serve anche per le immagini referenziate nell'HTML)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
+    elimina_grafici_aggregati_vecchi()
     
     # Genera grafici aggregati
     grafici_info = genera_grafici_aggregati(df_dettaglio, df_config)